@@ -0,0 +1,79 @@
+# compress the packed store (made by Make_packed_dataset.py) into chunks that can still be read at random, and
+# benchmark the codecs: size, bytes read, decode CPU time and samples per second of random and sequential reads
+import os
+import time
+import shutil
+import numpy as np
+import PathManager as pm
+import Datasets.PackedStore as store
+import Datasets.Codecs as codecs
+
+
+folder_path = pm.datasetroot
+data_path = os.path.join(folder_path, "train_augmented")
+codec = 'lz4'  # codec of the compressed store used by training ('raw', 'lz4' or 'zstd')
+chunk_rows = 32  # samples per chunk: larger chunks compress better, smaller ones decode less per random read
+num_benchmark_samples = 2000
+
+
+# ======================================================================================================================
+#   Functions
+# ======================================================================================================================
+def read_samples(patches, masks, offsets):
+    # what RGBImageSet_packed.__getitem__ reads per sample
+    for offset in offsets:
+        np.array(patches[offset])
+        np.array(masks[offset])
+
+
+def Benchmark_codecs(store_path):
+    patches, masks, manifest, _ = store.open_store(store_path)
+    raw_size = patches.nbytes + masks.nbytes
+    rng = np.random.RandomState(0)
+    random_offsets = manifest['offset'][rng.randint(0, len(manifest), num_benchmark_samples)]
+    sequential_offsets = manifest['offset'][:num_benchmark_samples]
+
+    # baseline: the memory maps of the store
+    results = []
+    for order, offsets in [('random', random_offsets), ('sequential', sequential_offsets)]:
+        tm_start = time.time()
+        read_samples(patches, masks, offsets)
+        results.append(('memmap', order, raw_size, len(offsets) * (patches[0].nbytes + masks[0].nbytes), 0.0,
+                        len(offsets) / max(time.time() - tm_start, 1e-6)))
+
+    for name in codecs.available_codecs():
+        codec_path = os.path.join(store_path, 'codec_' + name)
+        if not os.path.exists(codec_path):
+            os.makedirs(codec_path)
+        size = codecs.write_chunked(os.path.join(codec_path, store.PATCH_CHUNKS), patches, name, chunk_rows) + \
+            codecs.write_chunked(os.path.join(codec_path, store.MASK_CHUNKS), masks, name, chunk_rows)
+
+        for order, offsets in [('random', random_offsets), ('sequential', sequential_offsets)]:
+            chunked_patches = codecs.ChunkedArray(os.path.join(codec_path, store.PATCH_CHUNKS))
+            chunked_masks = codecs.ChunkedArray(os.path.join(codec_path, store.MASK_CHUNKS))
+            tm_start = time.time()
+            read_samples(chunked_patches, chunked_masks, offsets)
+            results.append((name, order, size, chunked_patches.bytes_read + chunked_masks.bytes_read,
+                            chunked_patches.decode_time + chunked_masks.decode_time,
+                            len(offsets) / max(time.time() - tm_start, 1e-6)))
+        shutil.rmtree(codec_path)
+
+    print("%d samples per read order, %d samples per chunk (warm page cache)" % (num_benchmark_samples, chunk_rows))
+    print("%-8s %-10s %10s %7s %12s %12s %12s" % ('codec', 'order', 'size (MB)', 'ratio', 'read (MB)', 'decode (s)',
+                                                  'samples/s'))
+    for name, order, size, bytes_read, decode_time, samples_per_sec in results:
+        print("%-8s %-10s %10.1f %7.2f %12.1f %12.3f %12.1f" % (name, order, size / 2**20, raw_size / size,
+                                                               bytes_read / 2**20, decode_time, samples_per_sec))
+
+
+def Compress_packed_dataset(store_path):
+    size = store.compress_store(store_path, codec, chunk_rows)
+    print("the store is compressed with %s: %.1f MB" % (codec, size / 2**20))
+
+
+# ======================================================================================================================
+#   run
+# ======================================================================================================================
+if __name__ == '__main__':
+    Benchmark_codecs(store.get_store_path(data_path))
+    Compress_packed_dataset(store.get_store_path(data_path))
@@ -5,17 +5,27 @@
 # deciding patch size(odd case, even case)
 # main, (up, down, left, right)xn
 # applies flip to each patch
-# save to new folder
+# save to the packed store (or to new folders), frame by frame in a process pool
 import os
+import time
 import numpy as np
-import torch
 import glob
+from multiprocessing import Pool
+
+import Datasets.PackedStore as store
+from Datasets.Augmentation import NUM_ANCHORS, NUM_FLIPS, NUM_AUGMENTATIONS, get_image_anchors, flip_patch
 
 data_path = '/media/leejeyeol/74B8D3C8B8D38750/Data/CVC-ClinicDB/train'
 ground_truth_path = '/media/leejeyeol/74B8D3C8B8D38750/Data/CVC-ClinicDB/Ground_Truth'
 data_save_path = '/media/leejeyeol/74B8D3C8B8D38750/Data/CVC-ClinicDB/train_augmented'
 ground_truth_save_path = '/media/leejeyeol/74B8D3C8B8D38750/Data/CVC-ClinicDB/Ground_Truth_augmented'
 
+# 'packed': one store next to data_save_path (see Datasets/PackedStore.py), 'files': one .npy per patch
+output_format = 'packed'
+num_workers = 4
+journal_file = 'augmentation_journal.txt'
+layout_file = 'augmentation_layout.npz'  # frame list and patch shape the journal was written for
+
 
 def make_dir(path):
     # if there is no directory, make a directory.
@@ -26,51 +36,121 @@ def make_dir(path):
     return
 
 
+def get_sample_name(frame_path, anchor_index, flip_index):
+    return os.path.basename(frame_path).split('.')[0] + '_%d_%d.npy' % (anchor_index, flip_index)
 
-def get_mean_image():
-    mean_image = np.load(os.path.join(os.path.dirname(data_path), "mean_image.npy"))
-    mean_image = np.transpose(mean_image, (2, 0, 1))
-    mean_image = torch.from_numpy(mean_image).float()
-    return mean_image
-
-make_dir(data_save_path)
-make_dir(ground_truth_save_path)
-
-cur_file_paths = glob.glob(data_path + '/*.npy')
-cur_file_paths.sort()
-
-cur_GT_paths = glob.glob(ground_truth_path + '/*.npy')
-cur_GT_paths.sort()
-
-data = np.load(cur_file_paths[0])
-original_h = data.shape[0]
-original_w = data.shape[1]
-patch_h = int(original_h / 2)
-patch_w = int(original_w / 2)
-original_h = patch_h*2
-original_w = patch_w*2
 
-image_anchor = [[int(original_h/4),int(original_w/4)],[0,int(original_w/4)],[int(original_h/4),0],[int(original_h/4),int(original_w/2)],[int(original_h/2),int(original_w/4)]]
+def augment_frame(task):
+    # writes the 5 anchors x 4 flips of one frame. row of a patch = frame_index * 20 + anchor * 4 + flip
+    frame_index, frame_path, gt_path, patch_h, patch_w = task
+    data = np.load(frame_path)
+    GT = np.load(gt_path)
+    image_anchor = get_image_anchors(patch_h * 2, patch_w * 2)
 
-for i in range(len(cur_file_paths)):
-    print("[%d/%d]"%(i,len(cur_file_paths)))
+    if output_format == 'packed':
+        store_path = store.get_store_path(data_save_path)
+        patches = np.load(os.path.join(store_path, store.PATCH_FILE), mmap_mode='r+')
+        masks = np.load(os.path.join(store_path, store.MASK_FILE), mmap_mode='r+')
 
-    data = np.load(cur_file_paths[i])
-    GT = np.load(cur_GT_paths[i])
     for j, anchor in enumerate(image_anchor):
         patch = data[anchor[0]:anchor[0]+patch_h, anchor[1]:anchor[1]+patch_w, :]
-        np.save(os.path.join(data_save_path, os.path.basename(cur_file_paths[i]).split('.')[0] + '_%d_0.npy' % j), patch)
-        np.save(os.path.join(data_save_path, os.path.basename(cur_file_paths[i]).split('.')[0] + '_%d_1.npy' % j), np.flip(patch, 0))
-        np.save(os.path.join(data_save_path, os.path.basename(cur_file_paths[i]).split('.')[0] + '_%d_2.npy' % j), np.flip(patch, 1))
-        np.save(os.path.join(data_save_path, os.path.basename(cur_file_paths[i]).split('.')[0] + '_%d_3.npy' % j), np.flip(np.flip(patch, 0), 1))
-
         GT_patch = GT[anchor[0]:anchor[0]+patch_h, anchor[1]:anchor[1]+patch_w]
-        np.save(os.path.join(ground_truth_save_path, os.path.basename(cur_GT_paths[i]).split('.')[0] + '_%d_0.npy' % j), GT_patch)
-        np.save(os.path.join(ground_truth_save_path, os.path.basename(cur_GT_paths[i]).split('.')[0] + '_%d_1.npy' % j), np.flip(GT_patch, 0))
-        np.save(os.path.join(ground_truth_save_path, os.path.basename(cur_GT_paths[i]).split('.')[0] + '_%d_2.npy' % j), np.flip(GT_patch, 1))
-        np.save(os.path.join(ground_truth_save_path, os.path.basename(cur_GT_paths[i]).split('.')[0] + '_%d_3.npy' % j), np.flip(np.flip(GT_patch, 0), 1))
-
-
-
-
-
+        for k in range(NUM_FLIPS):
+            if output_format == 'packed':
+                row = frame_index * NUM_AUGMENTATIONS + j * NUM_FLIPS + k
+                patches[row] = np.transpose(flip_patch(patch, k), (2, 0, 1))
+                masks[row] = flip_patch(GT_patch, k)
+            else:
+                np.save(os.path.join(data_save_path, get_sample_name(frame_path, j, k)), flip_patch(patch, k))
+                np.save(os.path.join(ground_truth_save_path, get_sample_name(gt_path, j, k)), flip_patch(GT_patch, k))
+
+    if output_format == 'packed':
+        patches.flush()
+        masks.flush()
+    return frame_index
+
+
+def check_journal(journal_dir, cur_file_paths, patch_shape):
+    # True when the journal can be resumed: it was written for the same frames and patch shape. otherwise it is
+    # removed and the current layout is recorded for the new run
+    journal_path = os.path.join(journal_dir, journal_file)
+    layout_path = os.path.join(journal_dir, layout_file)
+    if os.path.exists(journal_path) and os.path.exists(layout_path):
+        layout = np.load(layout_path)
+        if list(layout['frame_paths']) == list(cur_file_paths) and tuple(layout['patch_shape']) == tuple(patch_shape):
+            return True
+    if os.path.exists(journal_path):
+        print("the journal in %s is for other frames or another patch shape, starting over" % journal_dir)
+        os.remove(journal_path)
+    make_dir(journal_dir)
+    np.savez(layout_path, frame_paths=np.asarray(cur_file_paths), patch_shape=np.asarray(patch_shape))
+    return False
+
+
+def prepare_packed_store(cur_file_paths, patch_h, patch_w, num_channels):
+    # the store and its manifest are fixed by the frame list and patch shape, so an interrupted run with the same
+    # ones is resumed in place; anything else rebuilds the store
+    store_path = store.get_store_path(data_save_path)
+    num_samples = len(cur_file_paths) * NUM_AUGMENTATIONS
+    if not check_journal(store_path, cur_file_paths, (num_channels, patch_h, patch_w)):
+        _, _, manifest = store.create_store(store_path, num_samples, (num_channels, patch_h, patch_w))
+    else:
+        manifest = np.zeros(num_samples, dtype=store.MANIFEST_DTYPE)
+
+    names = []
+    for i, frame_path in enumerate(cur_file_paths):
+        for j in range(NUM_ANCHORS):
+            for k in range(NUM_FLIPS):
+                row = i * NUM_AUGMENTATIONS + j * NUM_FLIPS + k
+                manifest[row] = (row, i, j, k, row)
+                names.append(get_sample_name(frame_path, j, k))
+    frame_names = [os.path.basename(frame_path).split('.')[0] for frame_path in cur_file_paths]
+    store.save_manifest(store_path, manifest, names, frame_names)
+    return store_path
+
+
+def run_augmentation():
+    cur_file_paths = glob.glob(data_path + '/*.npy')
+    cur_file_paths.sort()
+
+    cur_GT_paths = glob.glob(ground_truth_path + '/*.npy')
+    cur_GT_paths.sort()
+    assert len(cur_file_paths) == len(cur_GT_paths)
+
+    data = np.load(cur_file_paths[0], mmap_mode='r')
+    patch_h = int(data.shape[0] / 2)
+    patch_w = int(data.shape[1] / 2)
+
+    if output_format == 'packed':
+        journal_dir = prepare_packed_store(cur_file_paths, patch_h, patch_w, data.shape[2])
+    else:
+        make_dir(data_save_path)
+        make_dir(ground_truth_save_path)
+        check_journal(data_save_path, cur_file_paths, (data.shape[2], patch_h, patch_w))
+        journal_dir = data_save_path
+
+    # completion journal: one finished frame index per line
+    journal_path = os.path.join(journal_dir, journal_file)
+    done = set()
+    if os.path.exists(journal_path):
+        with open(journal_path) as f:
+            done = set(int(line) for line in f if line.strip())
+    tasks = [(i, cur_file_paths[i], cur_GT_paths[i], patch_h, patch_w)
+             for i in range(len(cur_file_paths)) if i not in done]
+    print("%d frames are already done, %d frames to go" % (len(done), len(tasks)))
+
+    start_time = time.time()
+    pool = Pool(num_workers)
+    with open(journal_path, 'a') as journal:
+        for count, frame_index in enumerate(pool.imap_unordered(augment_frame, tasks), 1):
+            journal.write('%d\n' % frame_index)
+            journal.flush()
+            elapsed = time.time() - start_time
+            print("[%d/%d] %.1f frames/s" % (len(done) + count, len(cur_file_paths), count / max(elapsed, 1e-6)))
+    pool.close()
+    pool.join()
+    print("augmentation is done in %.1f sec" % (time.time() - start_time))
+
+
+if __name__ == '__main__':
+    run_augmentation()
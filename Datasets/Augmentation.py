@@ -0,0 +1,51 @@
+import numpy as np
+import torch
+
+# five anchors (center, up, left, right, down) x four flips (none, vertical, horizontal, both)
+NUM_ANCHORS = 5
+NUM_FLIPS = 4
+NUM_AUGMENTATIONS = NUM_ANCHORS * NUM_FLIPS
+
+
+def get_image_anchors(h, w):
+    # top-left corners of the half-size patches cropped from an (h, w) frame
+    return [[int(h / 4), int(w / 4)], [0, int(w / 4)],
+            [int(h / 4), 0], [int(h / 4), int(w / 2)],
+            [int(h / 2), int(w / 4)]]
+
+
+def flip_patch(patch, flip_index, axes=(0, 1)):
+    # flip_index follows the '_<anchor>_<flip>.npy' naming of Data_Augmentation.py
+    if flip_index == 0:
+        return patch
+    elif flip_index == 1:
+        return np.flip(patch, axes[0])
+    elif flip_index == 2:
+        return np.flip(patch, axes[1])
+    elif flip_index == 3:
+        return np.flip(np.flip(patch, axes[0]), axes[1])
+    raise ValueError('unknown flip index: %d' % flip_index)
+
+
+def parse_sample_name(name):
+    # expect naming format '<frame>_<anchor>_<flip>.npy'
+    name_splits = name.split('.')[0].split('_')
+    return name_splits[0], int(name_splits[1]), int(name_splits[2])
+
+
+def get_patch_index(anchor_index, flip_index):
+    return anchor_index * NUM_FLIPS + flip_index
+
+
+def make_mean_patch_table(mean_image):
+    # mean_image: (h w c) array. returns (20, c, h/2, w/2) contiguous float tensor, row = get_patch_index(...)
+    h = mean_image.shape[0]
+    w = mean_image.shape[1]
+    mean_patches = []
+    for anchor in get_image_anchors(h, w):
+        mean_patch = mean_image[anchor[0]:anchor[0] + int(h/2), anchor[1]:anchor[1] + int(w/2), :]
+        for flip_index in range(NUM_FLIPS):
+            flipped = np.transpose(flip_patch(mean_patch, flip_index), (2, 0, 1))
+            mean_patches.append(torch.from_numpy(np.ascontiguousarray(flipped)).float())
+    # read-only for DataLoader workers; shared memory avoids one copy per worker
+    return torch.stack(mean_patches).share_memory_()
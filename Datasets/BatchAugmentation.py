@@ -0,0 +1,49 @@
+import torch
+
+
+class BatchAugmentation(object):
+    # random shift (crop of a padded batch), flips and photometric jitter of a whole collated batch, drawn per sample.
+    # runs on the centered batch from BatchNormalizer, on whatever device it lives. the mask ((n 1 h w) weights,
+    # 0 = polyp) goes through the same shift and flips; the padded border gets weight 0, so it is out of the loss
+    def __init__(self, max_shift=16, flip=True, brightness=0.0, contrast=0.0):
+        self.max_shift = max_shift
+        self.flip = flip
+        self.brightness = brightness
+        self.contrast = contrast
+
+    def __call__(self, data, mask):
+        if self.max_shift > 0:
+            data, mask = self.random_crop(data, mask)
+        if self.flip:
+            data, mask = self.random_flip(data, mask, 3)
+            data, mask = self.random_flip(data, mask, 2)
+        if self.brightness > 0 or self.contrast > 0:
+            data = self.jitter(data)
+        return data, mask
+
+    def random_crop(self, data, mask):
+        # crop of the input size at a random offset of the zero-padded batch (0 is the mean in centered data)
+        n, _, h, w = data.size()
+        p = self.max_shift
+        offset_y = torch.randint(0, 2 * p + 1, (n, 1), device=data.device)
+        offset_x = torch.randint(0, 2 * p + 1, (n, 1), device=data.device)
+        rows = (torch.arange(h, device=data.device).unsqueeze(0) + offset_y)[:, :, None]  # (n h 1)
+        cols = (torch.arange(w, device=data.device).unsqueeze(0) + offset_x)[:, None, :]  # (n 1 w)
+        batch = torch.arange(n, device=data.device)[:, None, None]
+
+        # advanced indexing gives (n h w c); back to (n c h w)
+        data = torch.nn.functional.pad(data, (p, p, p, p))[batch, :, rows, cols].permute(0, 3, 1, 2)
+        mask = torch.nn.functional.pad(mask, (p, p, p, p))[batch, :, rows, cols].permute(0, 3, 1, 2)
+        return data.contiguous(), mask.contiguous()
+
+    @staticmethod
+    def random_flip(data, mask, dim):
+        flipped = (torch.rand(data.size(0), device=data.device) < 0.5).view(-1, 1, 1, 1)
+        return torch.where(flipped, data.flip(dim), data), torch.where(flipped, mask.flip(dim), mask)
+
+    def jitter(self, data):
+        # per-sample contrast (scale around the mean) and brightness (offset), in units of the centered data
+        n = data.size(0)
+        scale = 1 + (torch.rand(n, 1, 1, 1, device=data.device) * 2 - 1) * self.contrast
+        shift = (torch.rand(n, 1, 1, 1, device=data.device) * 2 - 1) * self.brightness
+        return data * scale + shift
@@ -0,0 +1,32 @@
+import torch
+
+
+class BatchNormalizer(object):
+    # datasets return raw (uint8) samples and single-channel uint8 masks; centering, scaling and mask broadcasting
+    # run here once per batch, on the training device
+    def __init__(self, mean_patches, centered=False, cuda=False):
+        # mean_patches: (P, c, h, w) float tensor. P == 1 for datasets without augmentation
+        self.centered = centered
+        self.cuda = cuda
+        self.mean_patches = mean_patches.cuda() if cuda else mean_patches
+
+    def to_device(self, tensor):
+        if self.cuda:
+            return tensor.cuda(non_blocking=True)
+        return tensor
+
+    def center(self, data, patch_index=None):
+        data = self.to_device(data).float()
+        if self.centered:
+            return data
+        if patch_index is None:
+            data.sub_(self.mean_patches[0])
+        else:
+            data.sub_(self.mean_patches[self.to_device(patch_index)])
+        return data.div_(255)
+
+    def expand_mask(self, mask, num_channels):
+        # (n 1 h w) uint8 ground truth (255 = polyp) => (n c h w) float weights (0 = polyp)
+        mask = self.to_device(mask).float()
+        mask = 1 - mask.div_(255)
+        return mask.expand(-1, num_channels, -1, -1)
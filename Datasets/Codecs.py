@@ -0,0 +1,126 @@
+import os
+import time
+import numpy as np
+
+# chunked compressed arrays. an (N, ...) array is cut into chunks of 'chunk_rows' rows along the first axis and each
+# chunk is compressed on its own, so a row is read by decoding only its chunk:
+#   <name>.chunks       : the compressed chunks, one after another
+#   <name>.chunks.npz   : index = chunk offsets in the file (num_chunks + 1), shape, dtype, codec, chunk_rows
+# codecs: 'raw' (no compression), 'lz4' (lz4 package) and 'zstd' (zstandard package). the last two are optional
+CHUNK_SUFFIX = '.chunks'
+INDEX_SUFFIX = '.chunks.npz'
+CODECS = ['raw', 'lz4', 'zstd']
+
+
+def get_codec(name, level=None):
+    # (compress, decompress) functions of bytes
+    if name == 'raw':
+        return bytes, bytes
+    if name == 'lz4':
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError("the 'lz4' codec needs the lz4 package (pip install lz4)")
+        return (lambda data: lz4.frame.compress(data, compression_level=level or 0)), lz4.frame.decompress
+    if name == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("the 'zstd' codec needs the zstandard package (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=level or 3).compress, zstandard.ZstdDecompressor().decompress
+    raise ValueError('unknown codec: %s (one of %s)' % (name, ', '.join(CODECS)))
+
+
+def available_codecs():
+    codecs = []
+    for name in CODECS:
+        try:
+            get_codec(name)
+            codecs.append(name)
+        except ImportError:
+            pass
+    return codecs
+
+
+def write_chunked(path, array, codec='lz4', chunk_rows=32, level=None):
+    # path without suffix, e.g. '<store>/patches'. array can be a memory map; it is read one chunk at a time
+    compress, _ = get_codec(codec, level)
+    offsets = [0]
+    with open(path + CHUNK_SUFFIX, 'wb') as f:
+        for start in range(0, len(array), chunk_rows):
+            chunk = compress(np.ascontiguousarray(array[start:start + chunk_rows]).tobytes())
+            f.write(chunk)
+            offsets.append(offsets[-1] + len(chunk))
+    np.savez(path + INDEX_SUFFIX, offsets=np.asarray(offsets, dtype=np.int64), shape=np.asarray(array.shape),
+             dtype=np.asarray(array.dtype.str), codec=np.asarray(codec), chunk_rows=np.asarray(chunk_rows))
+    return offsets[-1]
+
+
+def exists_chunked(path):
+    return os.path.exists(path + CHUNK_SUFFIX) and os.path.exists(path + INDEX_SUFFIX)
+
+
+class ChunkedArray(object):
+    # read-only array over a file made by write_chunked. indexing along the first axis (int, slice or integer array)
+    # decodes the touched chunks only; the last decoded chunk is kept for sequential reads.
+    # bytes_read and decode_time (CPU seconds) are accumulated for benchmarking
+    def __init__(self, path):
+        index = np.load(path + INDEX_SUFFIX)
+        self.path = path
+        self.offsets = index['offsets']
+        self.shape = tuple(int(dim) for dim in index['shape'])
+        self.dtype = np.dtype(str(index['dtype']))
+        self.codec = str(index['codec'])
+        self.chunk_rows = int(index['chunk_rows'])
+        self.ndim = len(self.shape)
+        self.row_shape = self.shape[1:]
+        self.decompress = None
+        self.file = None
+        self.pid = None
+        self.cached_chunk = (-1, None)
+        self.bytes_read = 0
+        self.decode_time = 0.0
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getstate__(self):
+        # open files and decoder objects stay in their process; loader workers open their own
+        state = self.__dict__.copy()
+        state['decompress'], state['file'], state['pid'], state['cached_chunk'] = None, None, None, (-1, None)
+        return state
+
+    def get_chunk(self, chunk_index):
+        if self.cached_chunk[0] == chunk_index:
+            return self.cached_chunk[1]
+        if self.pid != os.getpid():
+            # (re)opened in each process, so forked workers do not share a file position
+            self.file = open(self.path + CHUNK_SUFFIX, 'rb')
+            self.decompress = get_codec(self.codec)[1]
+            self.pid = os.getpid()
+        start, end = self.offsets[chunk_index], self.offsets[chunk_index + 1]
+        self.file.seek(start)
+        data = self.file.read(end - start)
+        self.bytes_read += len(data)
+
+        tm_decode_start = time.process_time()
+        chunk = np.frombuffer(self.decompress(data), dtype=self.dtype).reshape((-1,) + self.row_shape)
+        self.decode_time += time.process_time() - tm_decode_start
+        self.cached_chunk = (chunk_index, chunk)
+        return chunk
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            item = np.arange(*item.indices(len(self)))
+        if np.isscalar(item):
+            row = int(item) + len(self) if item < 0 else int(item)
+            return self.get_chunk(row // self.chunk_rows)[row % self.chunk_rows]
+
+        rows = np.asarray(item, dtype=np.int64)
+        rows = np.where(rows < 0, rows + len(self), rows)
+        result = np.empty((len(rows),) + self.row_shape, dtype=self.dtype)
+        # each chunk is decoded once, in file order
+        order = np.argsort(rows, kind='stable')
+        for position in order:
+            result[position] = self.get_chunk(rows[position] // self.chunk_rows)[rows[position] % self.chunk_rows]
+        return result
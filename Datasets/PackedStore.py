@@ -0,0 +1,113 @@
+import os
+import numpy as np
+
+import Datasets.Codecs as codecs
+
+# packed store layout (one directory, e.g. '<dataset root>/packed'):
+#   patches.npy         : (N, C, H, W) uint8, contiguous
+#   masks.npy           : (N, H, W) uint8, contiguous (raw ground truth, 255 = polyp)
+#   manifest.npy        : (N,) structured array, see MANIFEST_DTYPE
+#   names.npy           : (N,) sample file names of the original 'train_augmented' folder
+#   frames.npy          : (F,) names of the source frames, indexed by manifest['frame']
+#   fold_<k>_<type>.npy : int32 manifest ids of fold k, type = 'train' or 'test'
+#   valid_fraction.npy  : (N,) float32 fraction of non-polyp pixels per manifest id (made on first use)
+#   patches.chunks(.npz), masks.chunks(.npz) : optional compressed copies of the two above (see Datasets/Codecs.py)
+# every name is relative, so a store can be copied between hosts as it is.
+PATCH_FILE = 'patches.npy'
+MASK_FILE = 'masks.npy'
+MANIFEST_FILE = 'manifest.npy'
+NAME_FILE = 'names.npy'
+FRAME_FILE = 'frames.npy'
+FOLD_FILE = 'fold_%d_%s.npy'
+VALID_FRACTION_FILE = 'valid_fraction.npy'
+PATCH_CHUNKS = 'patches'
+MASK_CHUNKS = 'masks'
+
+# 'offset' is the row of the sample in patches.npy / masks.npy
+MANIFEST_DTYPE = np.dtype([('id', np.int32), ('frame', np.int32), ('anchor', np.int8), ('flip', np.int8),
+                           ('offset', np.int64)])
+
+
+def get_store_path(data_path):
+    # the store lives next to 'train_augmented', like the mean image and the fold lists
+    return os.path.join(os.path.dirname(os.path.normpath(data_path)), 'packed')
+
+
+def create_store(path, num_samples, patch_shape):
+    # patch_shape: (c, h, w). returns writable memory maps to be filled by the caller
+    if not os.path.exists(path):
+        os.makedirs(path)
+    # stale for the new patches and masks
+    stale_files = [VALID_FRACTION_FILE]
+    for chunk_name in [PATCH_CHUNKS, MASK_CHUNKS]:
+        stale_files += [chunk_name + codecs.CHUNK_SUFFIX, chunk_name + codecs.INDEX_SUFFIX]
+    for file_name in stale_files:
+        if os.path.exists(os.path.join(path, file_name)):
+            os.remove(os.path.join(path, file_name))
+    c, h, w = patch_shape
+    patches = np.lib.format.open_memmap(os.path.join(path, PATCH_FILE), mode='w+', dtype=np.uint8,
+                                        shape=(num_samples, c, h, w))
+    masks = np.lib.format.open_memmap(os.path.join(path, MASK_FILE), mode='w+', dtype=np.uint8,
+                                      shape=(num_samples, h, w))
+    manifest = np.zeros(num_samples, dtype=MANIFEST_DTYPE)
+    return patches, masks, manifest
+
+
+def save_manifest(path, manifest, names, frame_names):
+    np.save(os.path.join(path, MANIFEST_FILE), manifest)
+    np.save(os.path.join(path, NAME_FILE), np.asarray(names))
+    np.save(os.path.join(path, FRAME_FILE), np.asarray(frame_names))
+
+
+def compress_store(path, codec='lz4', chunk_rows=32, level=None):
+    # writes the compressed copies of patches and masks; returns their size in bytes
+    patches = np.load(os.path.join(path, PATCH_FILE), mmap_mode='r')
+    masks = np.load(os.path.join(path, MASK_FILE), mmap_mode='r')
+    return codecs.write_chunked(os.path.join(path, PATCH_CHUNKS), patches, codec, chunk_rows, level) + \
+        codecs.write_chunked(os.path.join(path, MASK_CHUNKS), masks, codec, chunk_rows, level)
+
+
+def open_store(path, compressed=False):
+    # read-only memory maps; slicing them does not copy or open any file.
+    # with 'compressed', chunked arrays over the compressed copies (same indexing along the first axis)
+    if compressed:
+        assert codecs.exists_chunked(os.path.join(path, PATCH_CHUNKS)), 'no compressed packed store in ' + path
+        patches = codecs.ChunkedArray(os.path.join(path, PATCH_CHUNKS))
+        masks = codecs.ChunkedArray(os.path.join(path, MASK_CHUNKS))
+    else:
+        assert os.path.exists(os.path.join(path, PATCH_FILE)), 'no packed store in ' + path
+        patches = np.load(os.path.join(path, PATCH_FILE), mmap_mode='r')
+        masks = np.load(os.path.join(path, MASK_FILE), mmap_mode='r')
+    manifest = np.load(os.path.join(path, MANIFEST_FILE))
+    names = np.load(os.path.join(path, NAME_FILE))
+    assert len(patches) == len(masks) and len(manifest) == len(names)
+    return patches, masks, manifest, names
+
+
+def load_frame_names(path):
+    return np.load(os.path.join(path, FRAME_FILE))
+
+
+def save_fold_indices(path, fold_number, op_type, indices):
+    np.save(os.path.join(path, FOLD_FILE % (fold_number, op_type)), np.asarray(indices, dtype=np.int32))
+
+
+def load_fold_indices(path, fold_number, op_type):
+    fold_path = os.path.join(path, FOLD_FILE % (fold_number, op_type))
+    assert os.path.exists(fold_path), 'no fold index file: ' + fold_path
+    return np.load(fold_path)
+
+
+def load_valid_fractions(path, manifest, masks, chunk_size=1024):
+    # computed once per store in chunks of rows, then cached next to the manifest
+    valid_fraction_path = os.path.join(path, VALID_FRACTION_FILE)
+    if os.path.exists(valid_fraction_path):
+        valid_fractions = np.load(valid_fraction_path)
+        if len(valid_fractions) == len(manifest):
+            return valid_fractions
+    valid_fractions = np.zeros(len(manifest), dtype=np.float32)
+    for start in range(0, len(manifest), chunk_size):
+        chunk_masks = masks[manifest['offset'][start:start + chunk_size]]
+        valid_fractions[start:start + chunk_size] = 1 - chunk_masks.mean(axis=(1, 2)) / 255
+    np.save(valid_fraction_path, valid_fractions)
+    return valid_fractions
@@ -0,0 +1,25 @@
+import torch.utils.data
+
+from Datasets.Samplers import IndexSetSampler
+
+
+class PersistentLoader(object):
+    # one DataLoader whose worker processes live as long as this object. a new index set (fold, resampled
+    # subset or evaluation order) is given with set_indices/set_sampler instead of building a new DataLoader
+    def __init__(self, dataset, batch_size=1, num_workers=0, pin_memory=False):
+        self.sampler = IndexSetSampler(range(len(dataset)))
+        self.loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, sampler=self.sampler,
+                                                  num_workers=num_workers, pin_memory=pin_memory,
+                                                  persistent_workers=num_workers > 0)
+
+    def set_indices(self, indices, shuffle=False):
+        self.sampler.set_indices(indices, shuffle)
+
+    def set_sampler(self, sampler):
+        self.sampler.set_sampler(sampler)
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        return iter(self.loader)
@@ -0,0 +1,76 @@
+import time
+import threading
+import queue
+import torch
+
+
+class Prefetcher(object):
+    # iterates a loader on a background thread and keeps up to 'depth' batches ready. with cuda the batches are
+    # pinned and copied to the GPU on a side stream (non-blocking); otherwise it is a plain double-buffered queue.
+    # 'wait_time' is the time the training loop spent waiting for data in the last epoch
+    def __init__(self, loader, cuda=False, depth=2):
+        self.loader = loader
+        self.cuda = cuda and torch.cuda.is_available()
+        self.depth = depth
+        self.wait_time = 0.0
+        self.stream = torch.cuda.Stream() if self.cuda else None
+
+    def __len__(self):
+        return len(self.loader)
+
+    def to_device(self, batch):
+        if not self.cuda:
+            return batch, None
+        with torch.cuda.stream(self.stream):
+            batch = [item.pin_memory().cuda(non_blocking=True) if isinstance(item, torch.Tensor) else item
+                     for item in batch]
+            ready = torch.cuda.Event()
+            ready.record(self.stream)
+        return batch, ready
+
+    @staticmethod
+    def put(buffer, stop, item):
+        # blocks until there is room or the consumer has stopped; False when it has stopped
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(self, buffer, stop):
+        try:
+            for batch in self.loader:
+                if not self.put(buffer, stop, self.to_device(batch)):
+                    return
+            self.put(buffer, stop, StopIteration())
+        except Exception as e:
+            self.put(buffer, stop, e)
+
+    def __iter__(self):
+        self.wait_time = 0.0
+        buffer = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        producer = threading.Thread(target=self.produce, args=(buffer, stop))
+        producer.daemon = True
+        producer.start()
+        try:
+            while True:
+                tm_wait_start = time.time()
+                item = buffer.get()
+                self.wait_time += time.time() - tm_wait_start
+                if isinstance(item, StopIteration):
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                batch, ready = item
+                if ready is not None:
+                    torch.cuda.current_stream().wait_event(ready)
+                    for tensor in batch:
+                        if isinstance(tensor, torch.Tensor):
+                            tensor.record_stream(torch.cuda.current_stream())
+                yield batch
+        finally:
+            stop.set()
+            producer.join()
@@ -3,6 +3,8 @@ import glob
 import torch.utils.data
 import numpy as np
 
+from Datasets.BatchNormalizer import BatchNormalizer
+
 class RGBImageSet(torch.utils.data.Dataset):
     def __init__(self, path, centered=False):
         super().__init__()
@@ -27,17 +29,13 @@ class RGBImageSet(torch.utils.data.Dataset):
         data = np.transpose(data, (2, 0, 1))
         # (h w c) => (c h w)
 
-        if data.dtype.name == 'uint8':
-            data = data.astype(float)
-
-        if self.centered:
-            data = torch.FloatTensor(data)
-        else:
-            data = torch.FloatTensor(data)
-            data = data - self.mean_image
-            data.div_(255)
+        # raw sample; centering runs per batch in BatchNormalizer
+        data = torch.from_numpy(np.ascontiguousarray(data))
         return data
 
+    def get_batch_normalizer(self, cuda=False):
+        return BatchNormalizer(self.mean_image.unsqueeze(0), self.centered, cuda)
+
     def get_decenterd_data(self, centered_data):
         result = centered_data.mul_(255) + self.mean_image
         result = result.byte()
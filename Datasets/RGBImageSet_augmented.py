@@ -3,6 +3,9 @@ import glob
 import torch.utils.data
 import numpy as np
 
+from Datasets.BatchNormalizer import BatchNormalizer
+from Datasets.Augmentation import get_patch_index, make_mean_patch_table, parse_sample_name
+
 
 class RGBImageSet_augmented(torch.utils.data.Dataset):
     def __init__(self, path, op_type='train', centered=False, fold_number=None):
@@ -14,6 +17,7 @@ class RGBImageSet_augmented(torch.utils.data.Dataset):
         assert os.path.exists(path)
         self.base_path = path
         self.mean_image = self.get_mean_image()
+        self.mean_patches = make_mean_patch_table(self.mean_image)
 
         if fold_number is not None:
             if op_type == 'train':
@@ -27,6 +31,12 @@ class RGBImageSet_augmented(torch.utils.data.Dataset):
         cur_file_paths.sort()
         self.file_paths = cur_file_paths
 
+        # row of the mean patch table for each sample
+        self.patch_indices = np.zeros(len(self.file_paths), dtype=np.int64)
+        for i, file_path in enumerate(self.file_paths):
+            _, anchor_index, flip_index = parse_sample_name(os.path.basename(file_path))
+            self.patch_indices[i] = get_patch_index(anchor_index, flip_index)
+
     def __len__(self):
         return len(self.file_paths)
 
@@ -35,45 +45,26 @@ class RGBImageSet_augmented(torch.utils.data.Dataset):
         data_name = self.file_paths[item].split('/')[-1]
         mask = np.load(os.path.join(os.path.split(os.path.dirname(self.file_paths[item]))[0], 'Ground_Truth_augmented',
                                     os.path.split(self.file_paths[item])[1]))
-        mask = (np.ones(mask.shape) - mask / 255)
-
-        mask = np.repeat(mask[:, :, np.newaxis], 3, axis=2)
-        if mask.shape[0] != 1 and mask.shape[0] != 3:
-            mask = np.transpose(mask, (2, 0, 1))
+        mask = np.asarray(mask, dtype=np.uint8)[np.newaxis, :, :]  # (1 h w)
         if data.shape[0] != 1 and data.shape[0] != 3:
             data = np.transpose(data, (2, 0, 1))
         # (h w c) => (c h w)
 
-        if data.dtype.name == 'uint8':
-            data = data.astype(float)
-
-        if self.centered:
-            data = torch.FloatTensor(data)
-        else:
-            data = torch.FloatTensor(data)
+        # raw samples; centering runs per batch in BatchNormalizer
+        data = torch.from_numpy(np.ascontiguousarray(data))
+        mask = torch.from_numpy(np.ascontiguousarray(mask))
+        return data, mask, data_name, self.patch_indices[item]
 
-            h = self.mean_image.shape[0]
-            w = self.mean_image.shape[1]
-            image_anchor = [[int(h / 4), int(w / 4)], [0, int(w / 4)],
-                            [int(h / 4), 0], [int(h / 4), int(w / 2)],
-                            [int(h / 2), int(w / 4)]]
+    def get_fold_indices(self, fold_number, op_type='train'):
+        # positions of the samples of a fold list in this dataset (a dataset made with fold_number=None)
+        fold_paths = np.load(os.path.join(os.path.split(self.base_path)[0],
+                                          '10fold_%d_%s.npy' % (fold_number, op_type)))
+        name_to_item = {os.path.basename(file_path): i for i, file_path in enumerate(self.file_paths)}
+        return np.sort(np.asarray([name_to_item[os.path.basename(fold_path)] for fold_path in fold_paths],
+                                  dtype=np.int64))
 
-            anchor_index = int(os.path.basename(self.file_paths[item]).split('.')[0].split('_')[1])
-            flip_index = int(os.path.basename(self.file_paths[item]).split('.')[0].split('_')[2])
-            mean_patch = self.mean_image[image_anchor[anchor_index][0]:image_anchor[anchor_index][0] + int(h/2), image_anchor[anchor_index][1]:image_anchor[anchor_index][1] + int(w/2),:]
-            if flip_index == 0:
-                mean_patch = mean_patch
-            elif flip_index == 1:
-                mean_patch = np.flip(mean_patch, 0)
-            elif flip_index == 2:
-                mean_patch = np.flip(mean_patch, 1)
-            elif flip_index == 3:
-                mean_patch = np.flip(np.flip(mean_patch, 0), 1)
-            mean_patch = np.transpose(mean_patch, (2, 0, 1))
-            mean_patch = torch.FloatTensor(mean_patch)
-            data = data - mean_patch
-            data.div_(255)
-        return data, mask, data_name
+    def get_batch_normalizer(self, cuda=False):
+        return BatchNormalizer(self.mean_patches, self.centered, cuda)
 
     def get_decenterd_data(self, centered_data):
         result = centered_data.mul_(255) + self.mean_image
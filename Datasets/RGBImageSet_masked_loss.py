@@ -4,6 +4,8 @@ import torch.utils.data
 import numpy as np
 import numpy.ma as ma
 
+from Datasets.BatchNormalizer import BatchNormalizer
+
 class RGBImageSet_masked_loss(torch.utils.data.Dataset):
     def __init__(self, path, type= 'train', centered=False, fold_number=None):
         super().__init__()
@@ -35,23 +37,18 @@ class RGBImageSet_masked_loss(torch.utils.data.Dataset):
     def __getitem__(self, item):
         data = np.load(self.file_paths[item])
         mask = np.load(os.path.join(os.path.split(os.path.dirname(self.file_paths[item]))[0], 'Ground_Truth', os.path.split(self.file_paths[item])[1]))
-        mask = (np.ones(mask.shape) - mask/255)
-
-        mask = np.repeat(mask[:, :, np.newaxis], 3, axis=2)
-        mask = np.transpose(mask, (2, 0, 1))
+        mask = np.asarray(mask, dtype=np.uint8)[np.newaxis, :, :]  # (1 h w)
         data = np.transpose(data, (2, 0, 1))
         # (h w c) => (c h w)
-        if data.dtype.name == 'uint8':
-            data = data.astype(float)
 
-        if self.centered:
-            data = torch.FloatTensor(data)
-        else:
-            data = torch.FloatTensor(data)
-            data = data - self.mean_image
-            data.div_(255)
+        # raw samples; centering runs per batch in BatchNormalizer
+        data = torch.from_numpy(np.ascontiguousarray(data))
+        mask = torch.from_numpy(np.ascontiguousarray(mask))
         return data, mask
 
+    def get_batch_normalizer(self, cuda=False):
+        return BatchNormalizer(self.mean_image.unsqueeze(0), self.centered, cuda)
+
     def get_decenterd_data(self, centered_data):
         result = centered_data.mul_(255) + self.mean_image
         result = result.byte()
@@ -0,0 +1,83 @@
+import os
+import copy
+import torch.utils.data
+import numpy as np
+
+import Datasets.PackedStore as store
+from Datasets.BatchNormalizer import BatchNormalizer
+from Datasets.Augmentation import get_patch_index, make_mean_patch_table
+
+
+class RGBImageSet_packed(torch.utils.data.Dataset):
+    # same samples as RGBImageSet_augmented, but read from the packed store made by Make_packed_dataset.py.
+    # 'compressed' reads the compressed copy of the store (see Compress_packed_dataset.py) instead of the memory maps
+    def __init__(self, path, op_type='train', centered=False, fold_number=None, compressed=False):
+        super().__init__()
+
+        self.centered = centered
+
+        self.base_path = path
+        self.store_path = store.get_store_path(path)
+        self.mean_image = self.get_mean_image()
+        self.mean_patches = make_mean_patch_table(self.mean_image)
+
+        self.patches, self.masks, self.manifest, self.names = store.open_store(self.store_path, compressed)
+        self.offsets = self.manifest['offset']
+        # row of the mean patch table for each sample
+        self.patch_indices = get_patch_index(self.manifest['anchor'].astype(np.int64),
+                                             self.manifest['flip'].astype(np.int64))
+
+        # manifest ids of the samples in this view
+        if fold_number is not None:
+            self.sample_indices = self.get_fold_indices(fold_number, op_type)
+        else:
+            self.sample_indices = np.arange(len(self.manifest), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.sample_indices)
+
+    def __getitem__(self, item):
+        sample = self.sample_indices[item]
+        offset = self.offsets[sample]
+        data = self.patches[offset]  # (c h w) view on the memory map
+        data_name = str(self.names[sample])
+
+        mask = self.masks[offset][np.newaxis, :, :]  # (1 h w)
+
+        # raw samples; centering runs per batch in BatchNormalizer
+        data = torch.from_numpy(np.array(data))
+        mask = torch.from_numpy(np.array(mask))
+        return data, mask, data_name, self.patch_indices[sample]
+
+    def get_fold_indices(self, fold_number, op_type='train'):
+        return store.load_fold_indices(self.store_path, fold_number, op_type).astype(np.int64)
+
+    def fold_view(self, fold_number, op_type='train'):
+        # shares the opened memory maps and the mean patch table; only the index array differs
+        view = copy.copy(self)
+        view.sample_indices = self.get_fold_indices(fold_number, op_type)
+        return view
+
+    def load_all(self):
+        # every sample of this view at once: (data, mask, names, patch_index)
+        offsets = self.offsets[self.sample_indices]
+        data = np.array(self.patches[offsets])
+        mask = np.array(self.masks[offsets][:, np.newaxis, :, :])
+        names = [str(self.names[sample]) for sample in self.sample_indices]
+        return data, mask, names, self.patch_indices[self.sample_indices]
+
+    def get_valid_fractions(self):
+        # fraction of non-polyp pixels of each sample in this view
+        return store.load_valid_fractions(self.store_path, self.manifest, self.masks)[self.sample_indices]
+
+    def get_batch_normalizer(self, cuda=False):
+        return BatchNormalizer(self.mean_patches, self.centered, cuda)
+
+    def get_decenterd_data(self, centered_data):
+        result = centered_data.mul_(255) + self.mean_image
+        result = result.byte()
+        return result
+
+    def get_mean_image(self):
+        mean_image = np.load(os.path.join(os.path.dirname(self.base_path), "mean_image.npy"))
+        return mean_image
@@ -0,0 +1,97 @@
+import os
+import glob
+import torch.utils.data
+import numpy as np
+
+from Datasets.BatchNormalizer import BatchNormalizer
+from Datasets.Augmentation import NUM_FLIPS, NUM_AUGMENTATIONS, get_image_anchors, flip_patch, get_patch_index, \
+    make_mean_patch_table
+
+
+class RGBImageSet_virtual(torch.utils.data.Dataset):
+    # same samples as RGBImageSet_augmented, but cropped and flipped from the original frames at load time.
+    # sample index = frame_index * 20 + anchor_index * 4 + flip_index
+    def __init__(self, path, op_type='train', centered=False, fold_number=None):
+        super().__init__()
+
+        self.centered = centered
+
+        # 'path' is the (possibly absent) 'train_augmented' folder; the originals are its siblings
+        self.base_path = path
+        self.frame_path = os.path.join(os.path.dirname(os.path.normpath(path)), 'train')
+        self.ground_truth_path = os.path.join(os.path.dirname(os.path.normpath(path)), 'Ground_Truth')
+        assert os.path.exists(self.frame_path)
+        self.mean_image = self.get_mean_image()
+        self.mean_patches = make_mean_patch_table(self.mean_image)
+
+        frame_paths = glob.glob(os.path.join(self.frame_path, '*.npy'))
+        frame_paths.sort()
+        self.frame_names = [os.path.basename(frame_path).split('.')[0] for frame_path in frame_paths]
+
+        # same cropping rule as Data_Augmentation.py
+        frame_shape = np.load(frame_paths[0], mmap_mode='r').shape
+        self.patch_h = int(frame_shape[0] / 2)
+        self.patch_w = int(frame_shape[1] / 2)
+        self.image_anchor = get_image_anchors(self.patch_h * 2, self.patch_w * 2)
+
+        if fold_number is not None:
+            self.sample_indices = self.get_fold_indices(fold_number, op_type)
+        else:
+            self.sample_indices = np.arange(len(self.frame_names) * NUM_AUGMENTATIONS, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.sample_indices)
+
+    def __getitem__(self, item):
+        sample = self.sample_indices[item]
+        frame_index, anchor_index, flip_index = self.split_sample_index(sample)
+        frame_name = self.frame_names[frame_index]
+        anchor = self.image_anchor[anchor_index]
+
+        # crops and flips are views; only the selected patch is read from the page cache
+        frame = np.load(os.path.join(self.frame_path, frame_name + '.npy'), mmap_mode='r')
+        data = frame[anchor[0]:anchor[0] + self.patch_h, anchor[1]:anchor[1] + self.patch_w, :]
+        data = flip_patch(data, flip_index)
+        data = np.transpose(data, (2, 0, 1))
+        # (h w c) => (c h w)
+
+        mask = np.load(os.path.join(self.ground_truth_path, frame_name + '.npy'), mmap_mode='r')
+        mask = mask[anchor[0]:anchor[0] + self.patch_h, anchor[1]:anchor[1] + self.patch_w]
+        mask = flip_patch(mask, flip_index)
+        mask = mask[np.newaxis, :, :]  # (1 h w)
+
+        # raw samples; centering runs per batch in BatchNormalizer
+        data = torch.from_numpy(np.ascontiguousarray(data))
+        mask = torch.from_numpy(np.ascontiguousarray(mask, dtype=np.uint8))
+        return data, mask, self.get_sample_name(sample), get_patch_index(anchor_index, flip_index)
+
+    def get_fold_indices(self, fold_number, op_type='train'):
+        # virtual sample indices of the samples of a fold list (positions in a dataset made with fold_number=None)
+        fold_paths = np.load(os.path.join(os.path.split(self.base_path)[0],
+                                          '10fold_%d_%s.npy' % (fold_number, op_type)))
+        name_to_sample = {self.get_sample_name(i): i for i in range(len(self.frame_names) * NUM_AUGMENTATIONS)}
+        return np.sort(np.asarray([name_to_sample[os.path.basename(fold_path)] for fold_path in fold_paths],
+                                  dtype=np.int64))
+
+    def get_batch_normalizer(self, cuda=False):
+        return BatchNormalizer(self.mean_patches, self.centered, cuda)
+
+    @staticmethod
+    def split_sample_index(sample):
+        frame_index, augmentation_index = divmod(int(sample), NUM_AUGMENTATIONS)
+        anchor_index, flip_index = divmod(augmentation_index, NUM_FLIPS)
+        return frame_index, anchor_index, flip_index
+
+    def get_sample_name(self, sample):
+        # same naming as the files written by Data_Augmentation.py
+        frame_index, anchor_index, flip_index = self.split_sample_index(sample)
+        return self.frame_names[frame_index] + '_%d_%d.npy' % (anchor_index, flip_index)
+
+    def get_decenterd_data(self, centered_data):
+        result = centered_data.mul_(255) + self.mean_image
+        result = result.byte()
+        return result
+
+    def get_mean_image(self):
+        mean_image = np.load(os.path.join(os.path.dirname(self.base_path), "mean_image.npy"))
+        return mean_image
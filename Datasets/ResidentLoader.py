@@ -0,0 +1,52 @@
+import torch
+import numpy as np
+
+from Datasets.Samplers import IndexSetSampler
+
+
+class ResidentLoader(object):
+    # keeps the whole dataset in one uint8 tensor and yields batches by shuffled index gathers. the gathers are new
+    # pageable tensors, so the Prefetcher pins each batch before its copy to the GPU.
+    # drop-in for DataLoader over the RGBImageSet_* datasets: batches are (data, mask, names, patch_index).
+    # like PersistentLoader, the index set can be changed with set_indices/set_sampler
+    def __init__(self, dataset, batch_size=1, shuffle=False):
+        self.batch_size = batch_size
+        self.sampler = IndexSetSampler(range(len(dataset)), shuffle)
+
+        if hasattr(dataset, 'load_all'):
+            # packed store: one gather from the memory maps
+            data, mask, self.names, patch_index = dataset.load_all()
+            self.data = torch.from_numpy(data)
+            self.mask = torch.from_numpy(mask)
+            self.patch_index = torch.from_numpy(np.asarray(patch_index, dtype=np.int64))
+        else:
+            first_data, first_mask, _, _ = dataset[0]
+            self.data = torch.ByteTensor(len(dataset), *first_data.size())
+            self.mask = torch.ByteTensor(len(dataset), *first_mask.size())
+            self.names = []
+            self.patch_index = torch.LongTensor(len(dataset))
+            for i in range(len(dataset)):
+                data, mask, name, patch_index = dataset[i]
+                self.data[i].copy_(data)
+                self.mask[i].copy_(mask)
+                self.names.append(name)
+                self.patch_index[i] = int(patch_index)
+
+        print('%d samples are loaded in memory (%.1f MB)'
+              % (len(self.names), (self.data.nelement() + self.mask.nelement()) / 1024.0 / 1024.0))
+
+    def set_indices(self, indices, shuffle=False):
+        self.sampler.set_indices(indices, shuffle)
+
+    def set_sampler(self, sampler):
+        self.sampler.set_sampler(sampler)
+
+    def __len__(self):
+        return (len(self.sampler) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        order = torch.LongTensor(list(self.sampler))
+        for start in range(0, len(order), self.batch_size):
+            batch_index = order[start:start + self.batch_size]
+            yield self.data.index_select(0, batch_index), self.mask.index_select(0, batch_index), \
+                [self.names[i] for i in batch_index.tolist()], self.patch_index.index_select(0, batch_index)
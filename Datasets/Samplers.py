@@ -0,0 +1,74 @@
+import torch
+import torch.utils.data
+import numpy as np
+
+
+def compute_valid_fractions(dataset):
+    # fraction of valid (non-polyp) pixels per sample of the dataset, as used by the masked loss
+    if hasattr(dataset, 'get_valid_fractions'):
+        return dataset.get_valid_fractions()
+    valid_fractions = np.zeros(len(dataset), dtype=np.float32)
+    for i in range(len(dataset)):
+        mask = dataset[i][1]
+        valid_fractions[i] = 1 - mask.float().mean() / 255
+    return valid_fractions
+
+
+class IndexSetSampler(torch.utils.data.Sampler):
+    # mutable set of dataset indices. a loader built on it keeps its workers while the index set changes
+    # (fold, resampled subset, evaluation order)
+    def __init__(self, indices=(), shuffle=False):
+        self.indices = torch.LongTensor(0)
+        self.shuffle = shuffle
+        self.sampler = None
+        self.set_indices(indices, shuffle)
+
+    def set_indices(self, indices, shuffle=False):
+        self.indices = torch.from_numpy(np.asarray(indices, dtype=np.int64))
+        self.shuffle = shuffle
+        self.sampler = None
+
+    def set_sampler(self, sampler):
+        # any sampler that yields dataset indices, e.g. MaskAwareSampler
+        self.sampler = sampler
+
+    def __iter__(self):
+        if self.sampler is not None:
+            return iter(self.sampler)
+        if self.shuffle:
+            return iter(self.indices[torch.randperm(len(self.indices))].tolist())
+        return iter(self.indices.tolist())
+
+    def __len__(self):
+        if self.sampler is not None:
+            return len(self.sampler)
+        return len(self.indices)
+
+
+class MaskAwareSampler(torch.utils.data.Sampler):
+    # skips samples whose valid fraction is below 'min_fraction', and with 'weighted' draws the rest with
+    # probability proportional to their valid fraction (with replacement, same number of draws per epoch).
+    # 'indices' are the dataset indices of the given fractions (default: 0 ... len(valid_fractions) - 1)
+    def __init__(self, valid_fractions, min_fraction=0.0, weighted=False, indices=None):
+        self.valid_fractions = torch.from_numpy(np.asarray(valid_fractions, dtype=np.float64))
+        self.weighted = weighted
+        self.candidates = torch.nonzero(self.valid_fractions >= min_fraction).view(-1)
+        assert len(self.candidates) > 0, 'no sample has a valid fraction over %f' % min_fraction
+        if indices is None:
+            self.indices = self.candidates
+        else:
+            self.indices = torch.from_numpy(np.asarray(indices, dtype=np.int64))[self.candidates]
+        print('%d / %d samples are kept by the mask-aware sampler' % (len(self.indices), len(self.valid_fractions)))
+
+    def __iter__(self):
+        if self.weighted:
+            weights = self.valid_fractions[self.candidates]
+            if weights.sum() <= 0:
+                weights = torch.ones(len(self.candidates)).double()
+            order = torch.multinomial(weights, len(self.candidates), replacement=True)
+        else:
+            order = torch.randperm(len(self.candidates))
+        return iter(self.indices[order].tolist())
+
+    def __len__(self):
+        return len(self.indices)
@@ -1,37 +1,82 @@
 import os
 import utils
 import numpy as np
-from collections import Counter
+import Datasets.PackedStore as store
+from Datasets.Augmentation import NUM_ANCHORS, NUM_FLIPS, NUM_AUGMENTATIONS, parse_sample_name
 
 
 folder_path = "/home/mlpa/data_ssd/workspace/dataset/CVC-ClinicDB"
 original_image_path = os.path.join(folder_path, "train_augmented")
+num_folds = 10
+seed = 0
 
 
 # ======================================================================================================================
 #   Functions
 # ======================================================================================================================
-def Make_10fold_list(original_image_path):
-    # call imagepath list
+def get_sample_names_and_frames(original_image_path):
+    # sample names and their source frame ids, from the packed manifest when there is one, else from the
+    # 'train_augmented' files, else from the original frames (the samples of RGBImageSet_virtual)
+    store_path = store.get_store_path(original_image_path)
+    if os.path.exists(os.path.join(store_path, store.MANIFEST_FILE)):
+        _, _, manifest, names = store.open_store(store_path)
+        return [str(name) for name in names], manifest['frame'].astype(np.int64)
+    if not os.path.isdir(original_image_path):
+        return get_virtual_sample_names_and_frames(original_image_path)
+
     image_list = utils.get_file_paths(original_image_path, "/*.", ['npy', 'NPY'])
-    # load image and ..
-    num_of_test = int(len(image_list)/10)
+    names = [os.path.basename(image_path) for image_path in image_list]
+    frame_ids = {}
+    frames = np.zeros(len(names), dtype=np.int64)
+    for i, name in enumerate(names):
+        frame_name = parse_sample_name(name)[0]
+        frames[i] = frame_ids.setdefault(frame_name, len(frame_ids))
+    return names, frames
+
+
+def get_virtual_sample_names_and_frames(original_image_path):
+    # NUM_AUGMENTATIONS samples per frame of the sibling 'train' folder, in the order and naming of
+    # RGBImageSet_virtual ('<frame>_<anchor>_<flip>.npy')
+    frame_path = os.path.join(os.path.dirname(os.path.normpath(original_image_path)), 'train')
+    frame_names = [os.path.basename(path).split('.')[0] for path in utils.get_file_paths(frame_path, "/*.", ['npy'])]
+    names = ['%s_%d_%d.npy' % (frame_name, anchor_index, flip_index)
+             for frame_name in frame_names for anchor_index in range(NUM_ANCHORS) for flip_index in range(NUM_FLIPS)]
+    frames = np.repeat(np.arange(len(frame_names), dtype=np.int64), NUM_AUGMENTATIONS)
+    return names, frames
+
 
-    for i in range(0, 10):
-        test_set = np.random.choice(image_list, num_of_test)
-        test_set.sort()
+def Make_kfold_list(original_image_path, num_folds=10, seed=0):
+    # split by source frame, so all crops and flips of a frame land in the same fold. O(number of samples)
+    names, frames = get_sample_names_and_frames(original_image_path)
+    if len(names) == 0:
+        raise IOError('no samples to split: no packed store, no files in %s and no frames in its sibling train '
+                      'folder' % original_image_path)
+    num_frames = int(frames.max()) + 1
 
-        c_all = Counter(image_list)
-        c_test = Counter(test_set)
-        diff = c_all - c_test
-        train_set = np.asarray(list(diff.elements()))
+    # shuffled frames are dealt to the folds in turn; fold sizes differ by at most one frame
+    frame_folds = np.empty(num_frames, dtype=np.int64)
+    frame_folds[np.random.RandomState(seed).permutation(num_frames)] = np.arange(num_frames) % num_folds
+    sample_folds = frame_folds[frames]
 
-        np.save(os.path.join(folder_path, "10fold_%d_train" % i), train_set)
-        np.save(os.path.join(folder_path, "10fold_%d_test" % i), test_set)
+    store_path = store.get_store_path(original_image_path)
+    has_store = os.path.exists(os.path.join(store_path, store.MANIFEST_FILE))
+    image_list = np.asarray([os.path.join(original_image_path, name) for name in names])
+
+    for i in range(num_folds):
+        test_set = np.flatnonzero(sample_folds == i).astype(np.int32)
+        train_set = np.flatnonzero(sample_folds != i).astype(np.int32)
+
+        # int32 manifest ids for the packed store, path lists for the file based datasets
+        if has_store:
+            store.save_fold_indices(store_path, i, 'train', train_set)
+            store.save_fold_indices(store_path, i, 'test', test_set)
+        np.save(os.path.join(folder_path, "%dfold_%d_train" % (num_folds, i)), image_list[train_set])
+        np.save(os.path.join(folder_path, "%dfold_%d_test" % (num_folds, i)), image_list[test_set])
+        print("fold %d : %d train / %d test samples" % (i, len(train_set), len(test_set)))
 
 
 # ======================================================================================================================
 #   run
 # ======================================================================================================================
-
-Make_10fold_list(original_image_path)
\ No newline at end of file
+if __name__ == '__main__':
+    Make_kfold_list(original_image_path, num_folds, seed)
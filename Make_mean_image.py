@@ -2,34 +2,75 @@ import os
 import cv2
 import numpy as np
 import utils
+from multiprocessing import Pool
 
 
 folder_path = "/media/leejeyeol/74B8D3C8B8D38750/Data/CVC-ClinicDB"
 original_image_path = os.path.join(folder_path, "Remove_Boundary")
+accumulator_path = os.path.join(folder_path, "mean_accumulator.npz")
+num_workers = 4
+chunk_size = 64
 
 #=======================================================================================================================
 #   Functions
 #=======================================================================================================================
+def accumulate_images(image_paths):
+    # partial float64 sums of one chunk of images
+    image_sum, image_sq_sum = None, None
+    for image_path in image_paths:
+        image = cv2.imread(image_path, -1).astype(np.float64)
+        if image_sum is None:
+            image_sum, image_sq_sum = np.zeros(image.shape), np.zeros(image.shape)
+        image_sum += image
+        image_sq_sum += image * image
+    return image_sum, image_sq_sum, len(image_paths)
+
+
+def load_accumulator(accumulator_path):
+    # (sum, sum of squares, count, names of the accumulated images)
+    if not os.path.exists(accumulator_path):
+        return None, None, 0, []
+    accumulator = np.load(accumulator_path)
+    return accumulator['sum'], accumulator['sq_sum'], int(accumulator['count']), list(accumulator['names'])
+
+
 def Make_mean_image(original_image_path):
     # call imagepath list
-    image_list=utils.get_file_paths(original_image_path, "/*.", ['png', 'PNG'])
-    # load image and ..
-    mean_image = None
-    for (i, image) in enumerate(image_list):
-        original_image = cv2.imread(image, -1)
-        if mean_image == None:
-            mean_image = original_image
-        else :
-            mean_image = (mean_image/2 + original_image/2)
-
-        print("[%d/%d]" % (i+1, len(image_list)))
-    cv2.imwrite(os.path.join(folder_path, 'mean_image.png'), mean_image)
+    image_list = utils.get_file_paths(original_image_path, "/*.", ['png', 'PNG'])
+
+    # fold only the new images into the stored accumulator
+    image_sum, image_sq_sum, count, names = load_accumulator(accumulator_path)
+    accumulated = set(names)
+    new_images = [image for image in image_list if os.path.basename(image) not in accumulated]
+    print("%d images are accumulated, %d new images" % (count, len(new_images)))
+
+    chunks = [new_images[i:i + chunk_size] for i in range(0, len(new_images), chunk_size)]
+    pool = Pool(num_workers)
+    for (i, (chunk_sum, chunk_sq_sum, chunk_count)) in enumerate(pool.imap_unordered(accumulate_images, chunks)):
+        if image_sum is None:
+            image_sum, image_sq_sum = chunk_sum, chunk_sq_sum
+        else:
+            image_sum += chunk_sum
+            image_sq_sum += chunk_sq_sum
+        count += chunk_count
+        print("[%d/%d]" % (i + 1, len(chunks)))
+    pool.close()
+    pool.join()
+    assert count > 0
+
+    names += [os.path.basename(image) for image in new_images]
+    np.savez(accumulator_path, sum=image_sum, sq_sum=image_sq_sum, count=count, names=np.asarray(names))
+
+    mean_image = image_sum / count
+    std_image = np.sqrt(np.maximum(image_sq_sum / count - mean_image * mean_image, 0))
+    cv2.imwrite(os.path.join(folder_path, 'mean_image.png'), np.uint8(np.round(mean_image)))
     np.save(os.path.join(folder_path, 'mean_image'), mean_image)
+    np.save(os.path.join(folder_path, 'std_image'), std_image)
 
 
 
 #=======================================================================================================================
 #   run
 #=======================================================================================================================
-
-Make_mean_image(original_image_path)
\ No newline at end of file
+if __name__ == '__main__':
+    Make_mean_image(original_image_path)
@@ -0,0 +1,71 @@
+# pack 'train_augmented' and 'Ground_Truth_augmented' into one contiguous store with a sample manifest
+# (see Datasets/PackedStore.py for the layout), and translate the 10-fold path lists into manifest ids
+import os
+import numpy as np
+import utils
+import PathManager as pm
+import Datasets.PackedStore as store
+from Datasets.Augmentation import parse_sample_name
+
+
+folder_path = pm.datasetroot
+data_path = os.path.join(folder_path, "train_augmented")
+ground_truth_path = os.path.join(folder_path, "Ground_Truth_augmented")
+num_folds = 10
+
+
+# ======================================================================================================================
+#   Functions
+# ======================================================================================================================
+def Make_packed_dataset(data_path, ground_truth_path):
+    sample_paths = utils.get_file_paths(data_path, "/*.", ['npy'])
+    assert len(sample_paths) > 0
+    names = [os.path.basename(sample_path) for sample_path in sample_paths]
+
+    first_patch = np.load(sample_paths[0])
+    patch_shape = (first_patch.shape[2], first_patch.shape[0], first_patch.shape[1])  # (h w c) => (c h w)
+    patches, masks, manifest = store.create_store(store.get_store_path(data_path), len(sample_paths), patch_shape)
+
+    frame_ids = {}
+    frame_names = []
+    for i, (sample_path, name) in enumerate(zip(sample_paths, names)):
+        frame_name, anchor_index, flip_index = parse_sample_name(name)
+        if frame_name not in frame_ids:
+            frame_ids[frame_name] = len(frame_names)
+            frame_names.append(frame_name)
+        manifest[i] = (i, frame_ids[frame_name], anchor_index, flip_index, i)
+
+        patches[i] = np.transpose(np.load(sample_path), (2, 0, 1))
+        masks[i] = np.load(os.path.join(ground_truth_path, name))
+
+        if 0 == (i + 1) % 1000 or i + 1 == len(sample_paths):
+            print("[%d/%d]" % (i + 1, len(sample_paths)))
+
+    patches.flush()
+    masks.flush()
+    store.save_manifest(store.get_store_path(data_path), manifest, names, frame_names)
+    print("%d samples of %d frames are packed" % (len(names), len(frame_names)))
+
+
+def Make_fold_indexes(data_path):
+    # '10fold_%d_<type>.npy' (absolute paths) => 'fold_%d_<type>.npy' (int32 manifest ids) in the store
+    store_path = store.get_store_path(data_path)
+    names = np.load(os.path.join(store_path, store.NAME_FILE))
+    name_to_id = {name: i for i, name in enumerate(names)}
+    for fold_number in range(num_folds):
+        for op_type in ['train', 'test']:
+            list_path = os.path.join(os.path.dirname(data_path), '10fold_%d_%s.npy' % (fold_number, op_type))
+            if not os.path.exists(list_path):
+                continue
+            indices = [name_to_id[os.path.basename(path)] for path in np.load(list_path)]
+            indices.sort()
+            store.save_fold_indices(store_path, fold_number, op_type, indices)
+            print("fold %d %s : %d samples" % (fold_number, op_type, len(indices)))
+
+
+# ======================================================================================================================
+#   run
+# ======================================================================================================================
+if __name__ == '__main__':
+    Make_packed_dataset(data_path, ground_truth_path)
+    Make_fold_indexes(data_path)
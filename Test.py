@@ -95,7 +95,9 @@ if not os.path.exists(error_save_path):
 for fold_number in range(10):
 
 
-    dataloader = torch.utils.data.DataLoader(dset.RGBImageSet_augmented(options.dataroot, type='test', centered=False, fold_number=fold_number),batch_size=options.batchSize, shuffle=False, num_workers=options.workers)
+    dataset = dset.RGBImageSet_augmented(options.dataroot, op_type='test', centered=False, fold_number=fold_number)
+    dataloader = torch.utils.data.DataLoader(dataset, batch_size=options.batchSize, shuffle=False, num_workers=options.workers)
+    normalizer = dataset.get_batch_normalizer(cuda=options.cuda)
 
     # normalize to -1~1
     ngpu = int(options.ngpu)
@@ -152,7 +154,7 @@ for fold_number in range(10):
     # training start
     print("Training Start!")
     for epoch in range(options.iteration):
-        for i, (data, mask_, data_name) in enumerate(dataloader, 0):
+        for i, (data, mask_, data_name, patch_index) in enumerate(dataloader, 0):
             ############################
             # (1) Update D network
             ###########################
@@ -161,10 +163,10 @@ for fold_number in range(10):
 
 
 
-            real_cpu = data
+            real_cpu = normalizer.center(data, patch_index)
             batch_size = real_cpu.size(0)
             input.data.resize_(real_cpu.size()).copy_(real_cpu)
-            mask.data.resize_(real_cpu.size()).copy_(mask_.float())
+            mask.data.resize_(real_cpu.size()).copy_(normalizer.expand_mask(mask_, real_cpu.size(1)))
 
             output, _ = net(input)
             output_for_vis = output.data
@@ -5,7 +5,7 @@ import os
 import os.path
 import errno
 import torch
-import codecs
+import gzip
 import numpy as np
 
 
@@ -21,12 +21,16 @@ class myMNIST(data.Dataset):
     training_file = 'training.pt'
     test_file = 'test.pt'
 
-    def __init__(self, root, train=True, transform=None, target_transform=None, download=False, sampling_prob=None):
+    def __init__(self, root, train=True, transform=None, target_transform=None, download=False, sampling_prob=None,
+                 tensor_native=False):
+        # tensor_native: samples are read from the uint8 tensor as float (1 x 28 x 28) tensors in [0, 1], the same as
+        # transforms.ToTensor() but without PIL; transform and target_transform are not used. see TensorBatchLoader
         self.root = root
         self.transform = transform
         self.target_transform = target_transform
         self.train = train  # training set or test set
-        self.digit_index = [[], [], [], [], [], [], [], [], [], []]
+        self.tensor_native = tensor_native
+        self.digit_index = []  # LongTensor of sample indices per digit
         self.sampling_pool = None
 
         if download:
@@ -39,14 +43,12 @@ class myMNIST(data.Dataset):
         if self.train:
             self.train_data, self.train_labels = torch.load(
                 os.path.join(root, self.processed_folder, self.training_file))
-            for i, label in enumerate(self.train_labels, 0):
-                self.digit_index[label] += [i]
-            self.sampling_pool = range(len(self.train_labels))
+            labels = self.train_labels
         else:
             self.test_data, self.test_labels = torch.load(os.path.join(root, self.processed_folder, self.test_file))
-            for i, label in enumerate(self.test_labels, 0):
-                self.digit_index[label] += [i]
-            self.sampling_pool = range(len(self.test_labels))
+            labels = self.test_labels
+        self.digit_index = [torch.nonzero(labels == digit).view(-1) for digit in range(10)]
+        self.sampling_pool = torch.arange(len(labels)).long()
 
         if sampling_prob is not None:
             self.resampling(sampling_prob)
@@ -57,6 +59,8 @@ class myMNIST(data.Dataset):
             img, target = self.train_data[samp_index], self.train_labels[samp_index]
         else:
             img, target = self.test_data[samp_index], self.test_labels[samp_index]
+        if self.tensor_native:
+            return img.float().div_(255).unsqueeze(0), target
         # doing this so that it is consistent with all other datasets
         # to return a PIL Image
         img = Image.fromarray(img.numpy(), mode='L')
@@ -73,13 +77,29 @@ class myMNIST(data.Dataset):
         else:
             return len(self.sampling_pool)
 
+    def get_batch(self, indices):
+        # gathers a whole batch at once (tensor-native); indices are positions in the sampling pool
+        samp_indices = self.sampling_pool[indices]
+        if self.train:
+            data, labels = self.train_data, self.train_labels
+        else:
+            data, labels = self.test_data, self.test_labels
+        return data[samp_indices].float().div_(255).unsqueeze(1), labels[samp_indices]
+
+    def to_cuda(self):
+        # keeps the whole (uint8) set on the GPU, so batches are gathered there
+        if self.train:
+            self.train_data, self.train_labels = self.train_data.cuda(), self.train_labels.cuda()
+        else:
+            self.test_data, self.test_labels = self.test_data.cuda(), self.test_labels.cuda()
+        self.sampling_pool = self.sampling_pool.cuda()
+
     def _check_exists(self):
         return os.path.exists(os.path.join(self.root, self.processed_folder, self.training_file)) and \
             os.path.exists(os.path.join(self.root, self.processed_folder, self.test_file))
 
     def download(self):
         from six.moves import urllib
-        import gzip
 
         if self._check_exists():
             return
@@ -101,21 +121,17 @@ class myMNIST(data.Dataset):
             file_path = os.path.join(self.root, self.raw_folder, filename)
             with open(file_path, 'wb') as f:
                 f.write(data.read())
-            with open(file_path.replace('.gz', ''), 'wb') as out_f, \
-                    gzip.GzipFile(file_path) as zip_f:
-                out_f.write(zip_f.read())
-            os.unlink(file_path)
 
-        # process and save as torch files
+        # process and save as torch files (the readers decompress the .gz files themselves)
         print('Processing...')
 
         training_set = (
-            read_image_file(os.path.join(self.root, self.raw_folder, 'train-images-idx3-ubyte')),
-            read_label_file(os.path.join(self.root, self.raw_folder, 'train-labels-idx1-ubyte'))
+            read_image_file(os.path.join(self.root, self.raw_folder, 'train-images-idx3-ubyte.gz')),
+            read_label_file(os.path.join(self.root, self.raw_folder, 'train-labels-idx1-ubyte.gz'))
         )
         test_set = (
-            read_image_file(os.path.join(self.root, self.raw_folder, 't10k-images-idx3-ubyte')),
-            read_label_file(os.path.join(self.root, self.raw_folder, 't10k-labels-idx1-ubyte'))
+            read_image_file(os.path.join(self.root, self.raw_folder, 't10k-images-idx3-ubyte.gz')),
+            read_label_file(os.path.join(self.root, self.raw_folder, 't10k-labels-idx1-ubyte.gz'))
         )
         with open(os.path.join(self.root, self.processed_folder, self.training_file), 'wb') as f:
             torch.save(training_set, f)
@@ -125,54 +141,72 @@ class myMNIST(data.Dataset):
         print('Done!')
 
     def resampling(self, sampling_prob):
+        # a random 'sampling_prob[digit]' fraction of the samples of each digit, in random order
         assert(10 == len(sampling_prob))
-        self.sampling_pool = []
+        sampling_pool = []
         for i, index_list in enumerate(self.digit_index, 0):
-            if 0 == sampling_prob[i]:
-                continue
             end_index = int(sampling_prob[i] * len(index_list))
-            np.random.shuffle(index_list)
-            self.sampling_pool += index_list[0:end_index]
-        np.random.shuffle(self.sampling_pool)
+            sampling_pool.append(index_list[torch.randperm(len(index_list))[0:end_index]])
+        sampling_pool = torch.cat(sampling_pool)
+        self.sampling_pool = sampling_pool[torch.randperm(len(sampling_pool))].to(self.sampling_pool.device)
+
+
+class TensorBatchLoader(object):
+    # batches of a tensor-native myMNIST by one gather per batch, in place of a DataLoader (no workers, no collation)
+    def __init__(self, dataset, batch_size=1, shuffle=False):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
 
+    def __len__(self):
+        return (len(self.dataset) + self.batch_size - 1) // self.batch_size
 
-def get_int(b):
-    return int(codecs.encode(b, 'hex'), 16)
+    def __iter__(self):
+        if self.shuffle:
+            order = torch.randperm(len(self.dataset)).to(self.dataset.sampling_pool.device)
+        else:
+            order = torch.arange(len(self.dataset)).long().to(self.dataset.sampling_pool.device)
+        for start in range(0, len(order), self.batch_size):
+            yield self.dataset.get_batch(order[start:start + self.batch_size])
 
 
-def parse_byte(b):
-    if isinstance(b, str):
-        return ord(b)
-    return b
+IDX_IMAGE_MAGIC = 2051  # 0x00000803: unsigned byte, 3 dimensions
+IDX_LABEL_MAGIC = 2049  # 0x00000801: unsigned byte, 1 dimension
 
 
-def read_label_file(path):
+def open_idx_file(path):
+    # gzip files ('.gz' or gzip magic bytes) are decompressed while reading
     with open(path, 'rb') as f:
-        data = f.read()
-        assert get_int(data[:4]) == 2049
-        length = get_int(data[4:8])
-        labels = [parse_byte(b) for b in data[8:]]
-        assert len(labels) == length
-        return torch.LongTensor(labels)
+        is_gzip = f.read(2) == b'\x1f\x8b'
+    return gzip.open(path, 'rb') if is_gzip else open(path, 'rb')
+
+
+def read_idx_file(path, magic):
+    # uint8 IDX file as a numpy array of the shape of its header. a raw file is memory-mapped, a gzip file is read
+    # as one buffer; both without any per-byte Python work
+    num_dims = magic & 0xff
+    with open_idx_file(path) as f:
+        header = f.read(4 + 4 * num_dims)
+        if len(header) != 4 + 4 * num_dims:
+            raise ValueError('%s: truncated IDX header' % path)
+        header = np.frombuffer(header, dtype='>i4')
+        if header[0] != magic:
+            raise ValueError('%s: IDX magic number %d, expected %d' % (path, header[0], magic))
+        shape = tuple(int(dim) for dim in header[1:])
+        if isinstance(f, gzip.GzipFile):
+            data = np.frombuffer(f.read(), dtype=np.uint8)
+        else:
+            data = np.memmap(path, dtype=np.uint8, mode='r', offset=len(header) * 4)
+    if len(data) != int(np.prod(shape)):
+        raise ValueError('%s: %d bytes of data for the shape %s' % (path, len(data), shape))
+    return data.reshape(shape)
+
+
+def read_label_file(path):
+    return torch.from_numpy(read_idx_file(path, IDX_LABEL_MAGIC).astype(np.int64))
 
 
 def read_image_file(path):
-    with open(path, 'rb') as f:
-        data = f.read()
-        assert get_int(data[:4]) == 2051
-        length = get_int(data[4:8])
-        num_rows = get_int(data[8:12])
-        num_cols = get_int(data[12:16])
-        images = []
-        idx = 16
-        for l in range(length):
-            img = []
-            images.append(img)
-            for r in range(num_rows):
-                row = []
-                img.append(row)
-                for c in range(num_cols):
-                    row.append(parse_byte(data[idx]))
-                    idx += 1
-        assert len(images) == length
-        return torch.ByteTensor(images).view(-1, 28, 28)
+    images = read_idx_file(path, IDX_IMAGE_MAGIC)
+    assert images.shape[1:] == (28, 28)
+    return torch.from_numpy(np.array(images))
@@ -3,12 +3,54 @@ import glob
 import torch.utils.data
 import numpy as np
 
+# the loader and samplers shared with the training code of the repository root. like 'legacy.models' in the legacy
+# scripts, this needs the repository root on the import path (e.g. PYTHONPATH)
+from Datasets.Samplers import IndexSetSampler
+from Datasets.PersistentLoader import PersistentLoader
+
+# frame memory map of a video folder made by endoscope_generate_sample.py: (T, c, x, y) uint8, every unique frame
+FRAME_MEMMAP_NAME = 'frames.npy'
+
+
+def get_image_samples(paths):
+    # (file path, frame index) of every frame of the video folders. a folder has one .npy per frame (frame index -1),
+    # or one frame memory map
+    file_paths, frame_indices = [], []
+    for path in paths:
+        frame_memmap_path = os.path.join(path, FRAME_MEMMAP_NAME)
+        if os.path.exists(frame_memmap_path):
+            # only the header is read here
+            num_frames = len(np.load(frame_memmap_path, mmap_mode='r'))
+            file_paths += [frame_memmap_path] * num_frames
+            frame_indices += range(num_frames)
+            continue
+        cur_file_paths = glob.glob(path + '/*.npy')
+        cur_file_paths.sort()
+        file_paths += cur_file_paths
+        frame_indices += [-1] * len(cur_file_paths)
+    return file_paths, frame_indices
+
+
+def load_image_sample(frames, file_path, frame_index):
+    # (c, x, y) view of a frame; frame memory maps are opened once and kept in 'frames' (dict per dataset object, so
+    # each loader worker opens its own)
+    if frame_index < 0:
+        return np.load(file_path, mmap_mode='r')
+    if file_path not in frames:
+        frames[file_path] = np.load(file_path, mmap_mode='r')
+    return frames[file_path][frame_index]
+
+
 class Grid_RGBImageSets(torch.utils.data.Dataset):
-    def __init__(self, path, centered=False, video_ids=None, grid_unit=4):
+    # each frame is cut into grid_unit x grid_unit cells and (grid_unit - 1) x (grid_unit - 1) cells shifted by half a
+    # cell, (16 + 9 = 25 for grid_unit 4). sample 'frame_index * num_grids + grid_number' is one cell, or with
+    # whole_frame sample 'frame_index' is all the cells of the frame at once, as a (num_grids, c, h, w) batch
+    def __init__(self, path, centered=False, video_ids=None, grid_unit=4, whole_frame=False):
         super().__init__()
         self.centered = centered
         self.grid_unit = grid_unit
-        self.add_string = lambda a, b: a + b
+        self.num_grids = (self.grid_unit * self.grid_unit) + ((self.grid_unit - 1) * (self.grid_unit - 1))
+        self.whole_frame = whole_frame
 
         assert os.path.exists(path)
         self.base_path = path
@@ -23,51 +65,69 @@ class Grid_RGBImageSets(torch.utils.data.Dataset):
         self.paths.sort()
         print(self.paths)
 
-        self.file_paths = []
-        for path in self.paths:
-            for grid in range(0, (self.grid_unit *self.grid_unit)+((self.grid_unit -1)*(self.grid_unit -1))):
-                cur_file_paths = glob.glob(path + '/*.npy')
-                cur_file_paths.sort()
-                self.file_paths += [realpath +"%"+ (("%02d")%(grid)) for realpath in cur_file_paths]
-        self.file_paths.sort()
+        self.file_paths, self.frame_indices = get_image_samples(self.paths)
+        if self.file_paths:
+            self.file_paths, self.frame_indices = map(list, zip(*sorted(zip(self.file_paths, self.frame_indices))))
+        self.frames = {}
 
+        self.grid_size = int(self.mean_image.shape[1] / self.grid_unit)
+        self.mean_grids = self.get_grids(self.mean_image)
 
     def __len__(self):
-        return len(self.file_paths)
+        if self.whole_frame:
+            return len(self.file_paths)
+        return len(self.file_paths) * self.num_grids
 
     def __getitem__(self, item):
-        paths = self.file_paths[item].split('%')
-        grid_number = paths[-1]
-        self.file_paths[item] = self.file_paths[item].replace('%'+grid_number, "")
-        grid_number = int(grid_number)
-
-        loaded_image = np.load(self.file_paths[item])
-        grid_size = int(loaded_image.shape[1]/self.grid_unit)
-
+        if self.whole_frame:
+            data = self.get_grids(torch.FloatTensor(np.array(self.load_image(item), dtype=np.float32)))
+            if not self.centered:
+                data = data - self.mean_grids
+                data.div_(255)
+            return data, torch.arange(self.num_grids)
+
+        frame_index, grid_number = divmod(item, self.num_grids)
+        grid_x, grid_y = self.get_grid_position(grid_number)
+
+        # only the rows of the cell are read from the file
+        loaded_image = self.load_image(frame_index)
+        data = torch.FloatTensor(np.array(loaded_image[:, grid_x:grid_x+self.grid_size,
+                                                       grid_y:grid_y+self.grid_size]))
+        if not self.centered:
+            data = data - self.mean_grids[grid_number]
+            data.div_(255)
+        return data, grid_number
 
+    def load_image(self, frame_index):
+        return load_image_sample(self.frames, self.file_paths[frame_index], self.frame_indices[frame_index])
 
+    def get_grid_position(self, grid_number):
+        # top-left corner of a cell
         if grid_number < (self.grid_unit*self.grid_unit):
             quo_grid_number = int(grid_number / self.grid_unit)
             rem_grid_number = grid_number % self.grid_unit
 
-            grid_x = int(grid_size * quo_grid_number)
-            grid_y = int(grid_size * rem_grid_number)
+            grid_x = int(self.grid_size * quo_grid_number)
+            grid_y = int(self.grid_size * rem_grid_number)
         else:
             sub_quo_grid_number = int((grid_number - (self.grid_unit * self.grid_unit)) / (self.grid_unit - 1))
             sub_rem_grid_number = (grid_number - (self.grid_unit * self.grid_unit)) % (self.grid_unit - 1)
 
-            grid_x = int(grid_size * sub_quo_grid_number + grid_size/2)
-            grid_y = int(grid_size * sub_rem_grid_number + grid_size/2)
-
-        if self.centered:
-            data = torch.FloatTensor(loaded_image)
-            data = data[:, grid_x:grid_x+grid_size, grid_y:grid_y+grid_size]
-        else:
-            data = torch.FloatTensor(loaded_image)
-            data = data[:, grid_x:grid_x+grid_size, grid_y:grid_y+grid_size]
-            data = data - self.mean_image[:, grid_x:grid_x+grid_size, grid_y:grid_y+grid_size]
-            data.div_(255)
-        return data, grid_number
+            grid_x = int(self.grid_size * sub_quo_grid_number + self.grid_size/2)
+            grid_y = int(self.grid_size * sub_rem_grid_number + self.grid_size/2)
+        return grid_x, grid_y
+
+    def get_grids(self, image):
+        # (c, H, W) => (num_grids, c, grid_size, grid_size), cells in grid_number order
+        size, half = self.grid_size, int(self.grid_size / 2)
+        main = image[:, :size*self.grid_unit, :size*self.grid_unit]
+        sub = image[:, half:half + size*(self.grid_unit - 1), half:half + size*(self.grid_unit - 1)]
+        grids = []
+        for cells in (main, sub):
+            # (c, rows, cols, size, size) view => (rows * cols, c, size, size)
+            cells = cells.unfold(1, size, size).unfold(2, size, size)
+            grids.append(cells.permute(1, 2, 0, 3, 4).reshape(-1, image.size(0), size, size))
+        return torch.cat(grids, 0)
 
     def get_decenterd_data(self, centered_data):
         result = centered_data.mul_(255) + self.mean_image
@@ -99,20 +159,18 @@ class RGBImageSets(torch.utils.data.Dataset):
         self.paths.sort()
         print(self.paths)
 
-        self.file_paths = []
-        for path in self.paths:
-            cur_file_paths = glob.glob(path + '/*.npy')
-            cur_file_paths.sort()
-            self.file_paths += cur_file_paths
+        self.file_paths, self.frame_indices = get_image_samples(self.paths)
+        self.frames = {}
 
     def __len__(self):
         return len(self.file_paths)
 
     def __getitem__(self, item):
+        image = load_image_sample(self.frames, self.file_paths[item], self.frame_indices[item])
         if self.centered:
-            data = torch.FloatTensor(np.load(self.file_paths[item]))
+            data = torch.FloatTensor(np.array(image, dtype=np.float32))
         else:
-            data = torch.FloatTensor(np.load(self.file_paths[item]))
+            data = torch.FloatTensor(np.array(image, dtype=np.float32))
             data = data - self.mean_image
             data.div_(255)
         return data
@@ -150,6 +208,7 @@ class VideoClipSets(torch.utils.data.Dataset):
         self.dataset_names = []
         self.video_names = []
         self.mean_images = {}
+        self.manifests = {}  # per path: (folder modification time, manifest)
         self.refresh_sample_info()
 
     def __len__(self):
@@ -162,7 +221,8 @@ class VideoClipSets(torch.utils.data.Dataset):
             data = torch.ByteTensor(np.load(self.file_paths[item])).float()
             data = data - self.mean_images[self.dataset_names[item]]
             data.div_(255)
-        return data, self.dataset_names[item], self.video_names[item], os.path.basename(self.file_paths[item])
+        return data, str(self.dataset_names[item]), str(self.video_names[item]), \
+            os.path.basename(self.file_paths[item])
 
     def add_path(self, path):
         # check path in path list
@@ -180,41 +240,60 @@ class VideoClipSets(torch.utils.data.Dataset):
         mean_image_cube = mean_image[np.newaxis, :, :].repeat(self.num_input_channel, axis=0)
         self.mean_images[dataset_name] = torch.FloatTensor(mean_image_cube)
 
+    def load_manifest(self, path):
+        # (file names, dataset names, video names) of the samples in 'path' as arrays sorted by file name.
+        # cached in memory and in '<path>_manifest.npz', both keyed by the modification time of the folder
+        mtime = os.stat(path).st_mtime
+        if path in self.manifests and self.manifests[path][0] == mtime:
+            return self.manifests[path][1]
+
+        manifest_path = os.path.normpath(path) + '_manifest.npz'
+        manifest = None
+        if os.path.exists(manifest_path):
+            cached = np.load(manifest_path)
+            if float(cached['mtime']) == mtime:
+                manifest = (cached['file_names'], cached['dataset_names'], cached['video_names'])
+        if manifest is None:
+            file_names = np.array(sorted(name for name in os.listdir(path) if name.endswith('.npy')))
+            # expect naming format 'avenue_video_01_frame_interval_1_stride_2_000000.npy'
+            name_splits = [name.split('_') for name in file_names]
+            manifest = (file_names.astype(np.str_),
+                        np.array([splits[0] for splits in name_splits], dtype=np.str_),
+                        np.array([splits[2] for splits in name_splits], dtype=np.str_))
+            try:
+                np.savez(manifest_path, mtime=mtime, file_names=manifest[0], dataset_names=manifest[1],
+                         video_names=manifest[2])
+            except OSError:
+                pass  # read-only dataset; the manifest is still kept in memory
+        self.manifests[path] = (mtime, manifest)
+        return manifest
+
     def refresh_sample_info(self):
-        # get file paths
-        self.file_paths = []
-        self.dataset_names = []
-        self.video_names = []
+        # merges the manifests of the paths; only a folder changed since its manifest was made is listed again
         self.mean_images = {}  # save negative mean images for saving computations
-        include_file_path = []
-        for path in self.paths:
-            assert os.path.exists(path)
+        file_paths, dataset_names, video_names = [], [], []
 
-            cur_file_paths = glob.glob(path + '/*.npy')
-            self.file_paths += cur_file_paths
-
-            cur_dataset_name = ''  # to use in loading mean image
-            for file_path in cur_file_paths:
-                # expect naming format 'avenue_video_01_frame_interval_1_stride_2_000000.npy'
-                name_splits = os.path.basename(file_path).split('_')
-                cur_dataset_name, cur_video_name = name_splits[0], name_splits[2]
+        # samples are sorted by (folder, file name)
+        for path in sorted(self.paths, key=lambda path: os.path.dirname(os.path.join(path, ''))):
+            assert os.path.exists(path)
+            cur_file_names, cur_dataset_names, cur_video_names = self.load_manifest(path)
 
-                if self.video_ids is None or int(cur_video_name) in self.video_ids:
-                    include_file_path += [file_path]
-                    self.dataset_names += [cur_dataset_name]
-                    self.video_names += [cur_video_name]
+            if self.video_ids is not None:
+                included = np.isin(cur_video_names.astype(np.int64), self.video_ids)
+                cur_file_names = cur_file_names[included]
+                cur_dataset_names = cur_dataset_names[included]
+                cur_video_names = cur_video_names[included]
+            file_paths.append(np.char.add(os.path.join(path, ''), cur_file_names))
+            dataset_names.append(cur_dataset_names)
+            video_names.append(cur_video_names)
 
             if not self.centered:
                 # make cube with mean image
-                self.generate_mean_cubes(path, cur_dataset_name)
-        self.file_paths = include_file_path
+                self.generate_mean_cubes(path, str(cur_dataset_names[-1]) if len(cur_dataset_names) > 0 else '')
 
-        # sort samples by file names
-        idx_path_pairs = [pair for pair in enumerate(self.file_paths, 0)]
-        idx_path_pairs = sorted(idx_path_pairs, key=lambda pair: (os.path.dirname(pair[1]), os.path.basename(pair[1])))
-        self.file_paths = [pair[1] for pair in idx_path_pairs]
-        self.dataset_names = [self.dataset_names[pair[0]] for pair in idx_path_pairs]
-        self.video_names = [self.video_names[pair[0]] for pair in idx_path_pairs]
+        self.file_paths = np.concatenate(file_paths) if file_paths else np.zeros(0, dtype=np.str_)
+        self.dataset_names = np.concatenate(dataset_names) if dataset_names else np.zeros(0, dtype=np.str_)
+        self.video_names = np.concatenate(video_names) if video_names else np.zeros(0, dtype=np.str_)
 
         # count samples
         assert len(self.file_paths) > 0
@@ -238,15 +317,271 @@ class VideoClipBootstrappingSets(VideoClipSets):
         self.dataset_names_original = self.dataset_names
         self.video_names_original = self.video_names
 
-    def resampling(self, sampling_probs):
-        self.file_paths = []
-        self.dataset_names = []
-        self.video_names = []
-        for i, prob in enumerate(sampling_probs, 0):
-            if prob > np.random.uniform():
-                self.file_paths += [self.file_paths_original[i]]
-                self.dataset_names += [self.dataset_names_original[i]]
-                self.video_names += [self.video_names_original[i]]
+    def resampling(self, sampling_probs, weighted=False):
+        indices = draw_bootstrap_indices(sampling_probs, weighted)
+        self.file_paths = self.file_paths_original[indices]
+        self.dataset_names = self.dataset_names_original[indices]
+        self.video_names = self.video_names_original[indices]
+
+
+def get_frame_path(path):
+    # frame memory maps of a sample folder (e.g. 'avenue/train') are in a sibling folder ('avenue/train_frames'),
+    # one '<dataset>_video_<video>.npy' per video. (T, H, W) for gray frames, (T, C, H, W) for multi-channel frames
+    return os.path.normpath(path) + '_frames'
+
+
+class VideoFrameSets(VideoClipSets):
+    # same samples as VideoClipSets, but cut from one frame memory map per video instead of one .npy per cube.
+    # a sample is a window of (num_input_channel / C) frames, taking every 'frame_interval'-th frame and starting at
+    # every 'sample_stride'-th of them (same as frame_stride and sample_stride of NIPS2017_generate_sample.py)
+    def __init__(self, paths, centered=False, num_input_channel=10, video_ids=None, frame_interval=1,
+                 sample_stride=2):
+        self.frame_interval = frame_interval
+        self.sample_stride = sample_stride
+        self.videos = []  # (dataset name, video name, frame memory map path, window length)
+        self.frames = {}  # opened memory maps, per video index (opened lazily, so in each loader worker)
+        self.value_scales = {}  # per dataset, when the frames are not 0~255 (quantized optical flow)
+        self.sample_videos = np.zeros(0, dtype=np.int32)
+        self.sample_starts = np.zeros(0, dtype=np.int32)
+        super().__init__(paths, centered, num_input_channel, video_ids)
+
+    def __len__(self):
+        return len(self.sample_videos)
+
+    def __getitem__(self, item):
+        video_index = self.sample_videos[item]
+        dataset_name, video_name, _, window_length = self.videos[video_index]
+        frames = self.get_frames(video_index)
+
+        # strided view on the memory map; only the frames of this window are read
+        start = int(self.sample_starts[item]) * self.frame_interval
+        cube = frames[start:start + window_length * self.frame_interval:self.frame_interval]
+        if cube.ndim == 4:
+            # (L C h w) => (C*L h w), channel-major like the cubes of VideoClipSets (e.g. vx frames, then vy frames)
+            cube = cube.transpose(1, 0, 2, 3).reshape(-1, cube.shape[2], cube.shape[3])
+
+        if self.centered:
+            data = torch.from_numpy(np.array(cube, dtype=np.float32))
+        else:
+            data = torch.from_numpy(np.array(cube)).float()
+            data = data - self.mean_images[dataset_name]
+            data.div_(self.value_scales.get(dataset_name, 255))
+        return data, dataset_name, video_name, self.get_sample_name(item)
+
+    def get_frames(self, video_index):
+        if video_index not in self.frames:
+            self.frames[video_index] = np.load(self.videos[video_index][2], mmap_mode='r')
+        return self.frames[video_index]
+
+    def add_path(self, path):
+        # the sample folder itself does not have to exist, only its frame memory maps
+        assert os.path.exists(get_frame_path(path))
+        self.paths.append(path)
+        self.refresh_sample_info()
+
+    def get_sample_name(self, item):
+        # file name of the same cube made by NIPS2017_generate_sample.py
+        dataset_name, video_name, _, _ = self.videos[self.sample_videos[item]]
+        return '%s_video_%s_frame_interval_%d_stride_%d_%06d.npy' \
+               % (dataset_name, video_name, self.frame_interval, self.sample_stride,
+                  self.sample_starts[item] // self.sample_stride)
+
+    def refresh_sample_info(self):
+        self.videos = []
+        self.frames = {}
+        self.mean_images = {}
+        self.value_scales = {}
+        sample_videos = []
+        sample_starts = []
+        for path in self.paths:
+            frame_path = get_frame_path(path)
+            assert os.path.exists(frame_path), 'no frame memory maps in ' + frame_path
+
+            cur_dataset_name = ''
+            for file_path in sorted(glob.glob(frame_path + '/*.npy')):
+                # expect naming format 'avenue_video_01.npy'
+                name_splits = os.path.basename(file_path).split('.')[0].split('_')
+                cur_dataset_name, cur_video_name = name_splits[0], name_splits[2]
+                if self.video_ids is not None and int(cur_video_name) not in self.video_ids:
+                    continue
+
+                # only the header is read here
+                frames = np.load(file_path, mmap_mode='r')
+                channels_per_frame = frames.shape[1] if frames.ndim == 4 else 1
+                window_length = self.num_input_channel // channels_per_frame
+                num_frames = (len(frames) + self.frame_interval - 1) // self.frame_interval
+                starts = np.arange(0, num_frames - window_length + 1, self.sample_stride, dtype=np.int32)
+
+                sample_videos.append(np.full(len(starts), len(self.videos), dtype=np.int32))
+                sample_starts.append(starts)
+                self.videos.append((cur_dataset_name, cur_video_name, file_path, window_length))
+
+            if not self.centered:
+                # make cube with mean image
+                self.generate_mean_cubes(path, cur_dataset_name)
+
+        self.sample_videos = np.concatenate(sample_videos) if sample_videos else np.zeros(0, dtype=np.int32)
+        self.sample_starts = np.concatenate(sample_starts) if sample_starts else np.zeros(0, dtype=np.int32)
+
+        # count samples
+        assert len(self.sample_videos) > 0
+
+
+class OpticalFlowFrameSets(VideoFrameSets):
+    # frame memory maps of (T, 2, H, W) optical flow (vx, vy); a sample is 9 vx frames followed by 9 vy frames.
+    # int16 flows of NIPS2017_generate_sample.py are round(flow * flow_scale) within +-flow_range; with their
+    # 'flow_range.npy', samples are (flow - mean) / flow_range instead of (image - mean) / 255, so in -1~+1 as well
+    def __init__(self, paths, centered=False, num_input_channel=18, video_ids=None, frame_interval=1,
+                 sample_stride=2):
+        super().__init__(paths, centered, num_input_channel, video_ids, frame_interval, sample_stride)
+
+    def generate_mean_cubes(self, path, dataset_name):
+        mean_cube = np.load(os.path.join(os.path.dirname(path), 'mean_cube.npy'))
+        self.mean_images[dataset_name] = torch.FloatTensor(mean_cube)
+        flow_range_path = os.path.join(os.path.dirname(path), 'flow_range.npy')
+        if os.path.exists(flow_range_path):
+            self.value_scales[dataset_name] = float(np.load(flow_range_path))
+
+
+class VideoFrameBootstrappingSets(VideoFrameSets):
+    def __init__(self, paths, centered=False, num_input_channel=10, video_ids=None, frame_interval=1,
+                 sample_stride=2):
+        super().__init__(paths, centered, num_input_channel, video_ids, frame_interval, sample_stride)
+        self.sample_videos_original = self.sample_videos
+        self.sample_starts_original = self.sample_starts
+
+    def resampling(self, sampling_probs, weighted=False):
+        indices = draw_bootstrap_indices(sampling_probs, weighted)
+        self.sample_videos = self.sample_videos_original[indices]
+        self.sample_starts = self.sample_starts_original[indices]
+
+
+def draw_bootstrap_indices(sampling_probs, weighted=False):
+    # one vectorized draw over all samples. Bernoulli: sample i is kept with probability sampling_probs[i].
+    # weighted: the expected number of Bernoulli draws, with replacement, in proportion to sampling_probs.
+    # drawn again until at least one sample is selected
+    sampling_probs = np.asarray(sampling_probs, dtype=np.float64)
+    assert sampling_probs.max() > 0, 'every sampling probability is zero'
+    while True:
+        if weighted:
+            num_draws = max(int(round(np.minimum(sampling_probs, 1).sum())), 1)
+            indices = np.random.choice(len(sampling_probs), num_draws, replace=True,
+                                       p=sampling_probs / sampling_probs.sum())
+        else:
+            indices = np.flatnonzero(sampling_probs > np.random.uniform(size=len(sampling_probs)))
+        if len(indices) > 0:
+            return indices
+
+
+class BootstrappingSampler(IndexSetSampler):
+    # index set drawn from per-sample probabilities, given to a PersistentLoader with set_sampler. the dataset and
+    # the loader's workers stay as they are
+    def __init__(self, num_samples, weighted=False):
+        super().__init__(range(num_samples), shuffle=True)
+        self.weighted = weighted
+
+    def resample(self, sampling_probs):
+        indices = draw_bootstrap_indices(sampling_probs, self.weighted)
+        self.set_indices(indices, shuffle=True)
+        return indices
+
+
+POPCOUNT_TABLE = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def pack_hash_bits(bits):
+    # (N, 64) bool => (N,) uint64
+    return np.packbits(np.asarray(bits, dtype=bool), axis=1).view('>u8').astype(np.uint64).ravel()
+
+
+def get_hamming_distances(hashes_a, hashes_b):
+    # number of different bits between uint64 hashes, elementwise
+    differences = np.ascontiguousarray(np.bitwise_xor(hashes_a, hashes_b), dtype=np.uint64)
+    return POPCOUNT_TABLE[differences.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def get_perceptual_hashes(dataset, batch_size=64, num_workers=0):
+    # 64-bit difference hash of every sample: the sample (channels and frames averaged) shrunk to 8 x 9 cells, one
+    # bit per cell brighter than its right neighbour. it does not change with the overall brightness of a frame
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, num_workers=num_workers)
+    hashes = []
+    for batch in loader:
+        data = batch[0] if isinstance(batch, (list, tuple)) else batch
+        data = data.float()
+        data = data.reshape(data.size(0), -1, data.size(-2), data.size(-1)).mean(1, keepdim=True)
+        cells = torch.nn.functional.adaptive_avg_pool2d(data, (8, 9))[:, 0]
+        hashes.append(pack_hash_bits((cells[:, :, :-1] > cells[:, :, 1:]).reshape(data.size(0), -1).numpy()))
+    return np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64)
+
+
+def get_latent_hashes(latents, seed=0):
+    # 64-bit random hyperplane hash of (N, ...) latent codes (e.g. AE encodings of the samples). the Hamming distance
+    # between two hashes follows the angle between the codes
+    latents = np.asarray(latents, dtype=np.float64).reshape(len(latents), -1)
+    latents = latents - latents.mean(axis=0)
+    hyperplanes = np.random.RandomState(seed).normal(size=(latents.shape[1], 64))
+    return pack_hash_bits(latents.dot(hyperplanes) > 0)
+
+
+def get_duplicate_clusters(hashes, max_distance=3, num_bands=None):
+    # near-duplicate clusters by LSH. the 64 bits are cut into num_bands bands (max_distance + 1 by default), and the
+    # samples with the same band share a bucket (two hashes within max_distance < num_bands bits always share one).
+    # a sample joins the lowest-index leader (first sample) of its buckets that is within max_distance bits of it, so
+    # the clusters do not chain along a slowly changing video. a leader can itself join a lower one, so the labels are
+    # made the smallest member index of each cluster at the end. returns the cluster label of every sample
+    hashes = np.ascontiguousarray(hashes, dtype=np.uint64)
+    sample_indices = np.arange(len(hashes))
+    clusters = sample_indices.copy()
+    num_bands = num_bands or min(max_distance + 1, 64)
+    band_bits = 64 // num_bands
+    for band in range(num_bands):
+        keys = (hashes >> np.uint64(band * band_bits)) & np.uint64(2**band_bits - 1)
+        order = np.lexsort((sample_indices, keys))  # by key, then by index
+        sorted_keys = keys[order]
+        bucket_starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        leaders = np.empty_like(order)
+        leaders[order] = order[np.repeat(bucket_starts, np.diff(np.r_[bucket_starts, len(order)]))]
+        is_close = get_hamming_distances(hashes, hashes[leaders]) <= max_distance
+        clusters = np.minimum(clusters, np.where(is_close, leaders, sample_indices))
+
+    # smallest member of each cluster
+    _, members = np.unique(clusters, return_inverse=True)
+    smallest_members = np.full(members.max() + 1 if len(members) else 0, len(hashes))
+    np.minimum.at(smallest_members, members, sample_indices)
+    return smallest_members[members]
+
+
+def get_dedup_index(clusters):
+    # deduplicated index subset (the smallest member of every cluster) and cluster weights (number of samples in it)
+    _, indices, weights = np.unique(clusters, return_index=True, return_counts=True)
+    return indices, weights
+
+
+def load_dedup_clusters(dataset, hash_path, max_distance=3, num_bands=None, batch_size=64, num_workers=0):
+    # the perceptual hashes of a dataset are made once and kept in 'hash_path' (.npz); only the clusters are made at
+    # each call
+    hashes = np.load(hash_path)['hashes'] if os.path.exists(hash_path) else None
+    if hashes is None or len(hashes) != len(dataset):
+        hashes = get_perceptual_hashes(dataset, batch_size, num_workers)
+        np.savez(hash_path, hashes=hashes)
+    return get_duplicate_clusters(hashes, max_distance, num_bands)
+
+
+class DedupSampler(IndexSetSampler):
+    # one sample of every near-duplicate cluster per epoch, a random one each epoch: an epoch is as long as the
+    # deduplicated index subset, and every sample is still drawn over the epochs
+    def __init__(self, clusters):
+        self.clusters = np.asarray(clusters, dtype=np.int64)
+        indices, self.weights = get_dedup_index(self.clusters)
+        super().__init__(indices, shuffle=True)
+
+    def __iter__(self):
+        # the first sample of every cluster, in the order of a random key
+        order = np.lexsort((np.random.uniform(size=len(self.clusters)), self.clusters))
+        sorted_clusters = self.clusters[order]
+        self.indices = torch.from_numpy(order[np.r_[True, sorted_clusters[1:] != sorted_clusters[:-1]]])
+        return super().__iter__()
+
 
 # ()()
 # ('')HAANJU.YOO
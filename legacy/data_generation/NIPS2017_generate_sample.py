@@ -4,11 +4,30 @@ import subprocess as sp
 from PIL import Image
 import numpy as np
 import glob
+import struct
+import cv2
+from multiprocessing import Pool
 
 FFMPEG_BIN = "ffmpeg"
 DATASET_BASE_PATH = os.environ['YCL_DATA_ROOT']
 
 opticalflow_version = True
+# 'cube': one .npy per sample (data.VideoClipSets), 'frames': one frame memory map per video (data.VideoFrameSets)
+sample_format = 'cube'
+# decode the videos through an ffmpeg pipe and make the mean image and the samples in the same pass (no PNG frames)
+streaming_decode = True
+# processes of the sample generation; one task per (dataset, video, frame stride), or per (dataset, video) when streaming
+num_workers = 4
+
+# optical flow made in the pipeline (streaming_decode): Farneback flow between consecutive frames, clipped to
+# +-flow_clip pixels and stored as round(flow * flow_scale) in int16 (T-1, 2, rows, cols) memory maps.
+# flow_range.npy (= flow_clip * flow_scale) maps them to -1~+1, the output range of the decoders (see
+# data.OpticalFlowFrameSets)
+flow_scale = 100.0
+flow_clip = 20.0
+flow_batch_size = 32  # flows written (and added to the mean) at once
+# pyr_scale, levels, winsize, iterations, poly_n, poly_sigma, flags
+farneback_params = (0.5, 3, 15, 3, 5, 1.2, 0)
 
 target_rows = 227
 target_cols = 227
@@ -247,222 +266,448 @@ def get_mean_image_opticalflow():
 # =============================================================================
 # GENERATE SAMPLES
 # =============================================================================
-def generate_samples(centering=False):
-
-    if centering:
-        numpy_dtype = np.float32
-    else:
-        numpy_dtype = np.uint8
-
-    # sample data container
-    sample_data = np.zeros((target_length, target_rows, target_cols), dtype=numpy_dtype)
+def get_frame_strides(name):
+    return [datasets[name]['frame_stride']] \
+        if isinstance(datasets[name]['frame_stride'], int) else datasets[name]['frame_stride']
+
+
+def get_ring_order(start_pos):
+    # ring buffer positions of the frames start_pos ... start_pos + target_length - 1, in time order
+    return (start_pos + np.arange(target_length)) % target_length
+
+
+def generate_video_samples(task):
+    # samples of one video with one frame stride. frame k of the video (after the frame stride) is kept at position
+    # k % target_length of a ring buffer, so each frame is read once and never moved
+    name, video, frame_stride, centering = task
+    numpy_dtype = np.float32 if centering else np.uint8
+    sample_stride = datasets[name]['sample_stride']
+    mean_image = np.load(os.path.join(datasets[name]['path'], 'mean_image.npy'))
+
+    # get paths of target images
+    image_folder = os.path.join(datasets[name]['path'], '%sing_videos' % datasets[name]['type'],
+                                os.path.splitext(datasets[name]['name_format'] % video)[0])
+    target_image_paths = get_file_paths(image_folder, '/*.', ['png', 'PNG'])[0::frame_stride]
+    num_frames = len(target_image_paths)
+
+    # different file name format and index among set type
+    file_name_format = '%s_video_%02d' % (datasets[name]['name'], video) + '_frame_interval_%d_stride_%d_%06d'
+
+    ring_buffer = np.zeros((target_length, target_rows, target_cols), dtype=numpy_dtype)
+    read_pos = 0
+    sample_count_wrt_video = 0
+    for start_pos in range(0, num_frames, sample_stride):
+        # check end-of-processing
+        if start_pos + target_length > num_frames:
+            break
+
+        # read and preprocess only unread images
+        for frame_pos in range(read_pos, start_pos + target_length):
+            image_data = np.array(Image.open(target_image_paths[frame_pos]), dtype=numpy_dtype)
+
+            # preprocessing
+            if centering:
+                image_data -= mean_image
+                image_data /= 255.0
+
+            # insert to sample container
+            ring_buffer[frame_pos % target_length] = image_data
+        read_pos = start_pos + target_length
+
+        save_file_path = os.path.join(datasets[name]['path'], datasets[name]['type'],
+                                      file_name_format % (frame_stride, sample_stride, sample_count_wrt_video))
+        np.save(save_file_path, ring_buffer[get_ring_order(start_pos)])
+        sample_count_wrt_video += 1
+
+    print('\tAt "%s" with frame stride %d and sample stride %d is done! (%d samples)'
+          % (datasets[name]['name_format'] % video, frame_stride, sample_stride, sample_count_wrt_video))
+    return name, sample_count_wrt_video
+
+
+def run_tasks(function, tasks):
+    # returns the number of generated samples per dataset
+    sample_counts = dict.fromkeys(target_datasets, 0)
+    pool = Pool(num_workers)
+    for name, sample_count in pool.imap_unordered(function, tasks):
+        sample_counts[name] += sample_count
+    pool.close()
+    pool.join()
+    return sample_counts
 
-    for i, name in enumerate(target_datasets):
-
-        print('Generate samples with "%s" dataset ... [%d/%d]' % (name, i+1, len(target_datasets)))
-
-        sample_stride = datasets[name]['sample_stride']
 
+def generate_samples(centering=False):
+    tasks = []
+    for name in target_datasets:
         # output folder
         make_dir(os.path.join(datasets[name]['path'], datasets[name]['type']))
-
-        # load mean image
-        mean_image = np.load(os.path.join(datasets[name]['path'], 'mean_image.npy'))
-
-        # loop to generate samples
-        total_sample_count = 0
-
-        frame_strides = [datasets[name]['frame_stride']] \
-            if isinstance(datasets[name]['frame_stride'], int) else datasets[name]['frame_stride']
-
-        for frame_stride in frame_strides:
-            stride_sample_count = 0
+        for frame_stride in get_frame_strides(name):
             for video in range(1, datasets[name]['num_videos'] + 1):
+                tasks.append((name, video, frame_stride, centering))
 
-                # print('  with frame stride %d and sample stride %d' % (frame_stride, sample_stride))
-                # get paths of target images
-                image_folder = os.path.join(datasets[name]['path'], '%sing_videos' % datasets[name]['type'],
-                                            os.path.splitext(datasets[name]['name_format'] % video)[0])
-                image_paths = get_file_paths(image_folder, ['png', 'PNG'])
-                target_image_paths = image_paths[0::frame_stride]
-                num_frames = len(target_image_paths)
-
-                # read target images and preprocess them
-                sys.stdout.write('\t"%s" with frame stride %d and sample stride %d ... [0/%d]'
-                                 % (datasets[name]['name_format'] % video, frame_stride, sample_stride, num_frames))
-                read_pos = 0
-                sample_count_wrt_video = 0
-                for start_pos in range(0, num_frames, sample_stride):
-                    sys.stdout.write('\r\tAt "%s" with frame stride %d and sample stride %d ... [%d/%d]'
-                                     % (datasets[name]['name_format'] % video, frame_stride, sample_stride, start_pos,
-                                        num_frames))
-
-                    # check end-of-processing
-                    if start_pos + target_length > num_frames:
-                        break
-
-                    # reallocate already read images
-                    sample_data = np.roll(sample_data, sample_stride, axis=0)
-
-                    # read and preprocess only unread images
-                    reading_images = target_image_paths[read_pos:start_pos+target_length]
-                    for j, path in enumerate(reading_images):
-                        image_data = np.array(Image.open(path), dtype=numpy_dtype)
-
-                        # preprocessing
-                        if centering:
-                            image_data -= mean_image
-                            image_data /= 255.0
-
-                        # insert to sample container
-                        sample_data[read_pos-start_pos+j] = image_data
-
-                    # different file name format and index among set type
-                    file_name_format = '%s_video_%02d' % (datasets[name]['name'], video) \
-                                       + '_frame_interval_%d_stride_%d_%06d'
-                    file_name_index = sample_count_wrt_video
-                    save_file_path = os.path.join(datasets[name]['path'], datasets[name]['type'],
-                                                  file_name_format % (frame_stride, sample_stride, file_name_index))
-                    np.save(save_file_path, sample_data)
-
-                    stride_sample_count += 1
-                    sample_count_wrt_video += 1
-                    read_pos = start_pos + target_length
-                print('\r\tAt "%s" with frame stride %d and sample stride %d is done!          '
-                      % (datasets[name]['name_format'] % video, frame_stride, sample_stride))
-
-            total_sample_count += stride_sample_count
-
-        print('%d samples are generated.' % total_sample_count)
+    print('Generate samples with %s datasets (%d tasks) ...' % (', '.join(target_datasets), len(tasks)))
+    for name, sample_count in run_tasks(generate_video_samples, tasks).items():
+        print('%s: %d samples are generated.' % (name, sample_count))
 
-def generate_samples_opticalflow(centering=False):
-    target_length_optical = target_length - 1
-    if centering:
-        numpy_dtype = np.float32
-    else:
-        numpy_dtype = np.uint8
 
-    # sample data container
-    sample_data_x = np.zeros((target_length_optical, target_rows, target_cols), dtype=numpy_dtype)
-    sample_data_y = np.zeros((target_length_optical, target_rows, target_cols), dtype=numpy_dtype)
+def generate_video_samples_opticalflow(task):
+    # same as generate_video_samples, with a ring buffer for each of vx and vy
+    name, video, frame_stride, centering = task
+    target_length_optical = target_length - 1
+    numpy_dtype = np.float32 if centering else np.uint8
+    sample_stride = datasets[name]['sample_stride']
+    optical_flow_path = os.path.join(DATASET_BASE_PATH, datasets[name]['name'], 'optical_flow')
+
+    # load mean image
+    mean_vx = np.load(os.path.join(optical_flow_path, 'mean_vx.npy'))
+    mean_vy = np.load(os.path.join(optical_flow_path, 'mean_vy.npy'))
+
+    # get paths of target images
+    image_folder = os.path.join(optical_flow_path, '%sing_videos' % datasets[name]['type'],
+                                os.path.splitext(datasets[name]['name_format'] % video)[0])
+    vx_target_image_paths = get_file_paths(image_folder, '/*vx.', ['png', 'PNG'])[0::frame_stride]
+    vy_target_image_paths = get_file_paths(image_folder, '/*vy.', ['png', 'PNG'])[0::frame_stride]
+    num_frames = len(vx_target_image_paths)
+
+    # different file name format and index among set type
+    file_name_format = '%s_video_%02d' % (datasets[name]['name'], video) + '_frame_interval_%d_stride_%d_%06d'
+
+    ring_buffer_x = np.zeros((target_length_optical, target_rows, target_cols), dtype=numpy_dtype)
+    ring_buffer_y = np.zeros((target_length_optical, target_rows, target_cols), dtype=numpy_dtype)
     sample_data = np.zeros((target_length_optical*2, target_rows, target_cols), dtype=numpy_dtype)
+    read_pos = 0
+    sample_count_wrt_video = 0
+    for start_pos in range(0, num_frames, sample_stride):
+        # check end-of-processing
+        if start_pos + target_length_optical > num_frames:
+            break
+
+        # read and preprocess only unread images
+        for frame_pos in range(read_pos, start_pos + target_length_optical):
+            vx_data = np.array(Image.open(vx_target_image_paths[frame_pos]), dtype=numpy_dtype)
+            vy_data = np.array(Image.open(vy_target_image_paths[frame_pos]), dtype=numpy_dtype)
+
+            # preprocessing
+            if centering:
+                vx_data -= mean_vx
+                vx_data /= 255.0
+                vy_data -= mean_vy
+                vy_data /= 255.0
+
+            # insert to sample container
+            ring_buffer_x[frame_pos % target_length_optical] = vx_data
+            ring_buffer_y[frame_pos % target_length_optical] = vy_data
+        read_pos = start_pos + target_length_optical
+
+        order = (start_pos + np.arange(target_length_optical)) % target_length_optical
+        sample_data[0:target_length_optical] = ring_buffer_x[order]
+        sample_data[target_length_optical:2*target_length_optical] = ring_buffer_y[order]
+
+        save_file_path = os.path.join(optical_flow_path, datasets[name]['type'],
+                                      file_name_format % (frame_stride, sample_stride, sample_count_wrt_video))
+        np.save(save_file_path, sample_data)
+        sample_count_wrt_video += 1
+
+    print('\tAt "%s" with frame stride %d and sample stride %d is done! (%d samples)'
+          % (datasets[name]['name_format'] % video, frame_stride, sample_stride, sample_count_wrt_video))
+    return name, sample_count_wrt_video
 
-    for i, name in enumerate(target_datasets):
-
-        print('Generate samples with "%s" dataset ... [%d/%d]' % (name, i + 1, len(target_datasets)))
-
-        sample_stride = datasets[name]['sample_stride']
 
+def generate_samples_opticalflow(centering=False):
+    tasks = []
+    for name in target_datasets:
         # output folder
         make_dir(os.path.join(DATASET_BASE_PATH, datasets[name]['name'], 'optical_flow', datasets[name]['type']))
-
-        # load mean image
-        mean_vx = np.load(os.path.join(DATASET_BASE_PATH, datasets[name]['name'], 'optical_flow', 'mean_vx.npy'))
-        mean_vy = np.load(os.path.join(DATASET_BASE_PATH, datasets[name]['name'], 'optical_flow', 'mean_vy.npy'))
-
-        # loop to generate samples
-        total_sample_count = 0
-
-        frame_strides = [datasets[name]['frame_stride']] \
-            if isinstance(datasets[name]['frame_stride'], int) else datasets[name]['frame_stride']
-
-        for frame_stride in frame_strides:
-            stride_sample_count = 0
+        for frame_stride in get_frame_strides(name):
             for video in range(1, datasets[name]['num_videos'] + 1):
+                tasks.append((name, video, frame_stride, centering))
 
-                # print('  with frame stride %d and sample stride %d' % (frame_stride, sample_stride))
-                # get paths of target images
-                image_folder = os.path.join(DATASET_BASE_PATH,  datasets[name]['name'],'optical_flow',
-                                            '%sing_videos' % datasets[name]['type'],
-                                            os.path.splitext(datasets[name]['name_format'] % video)[0])
-
-                vx_image_paths = get_file_paths(image_folder, '/*vx.', ['png', 'PNG'])
-                vy_image_paths = get_file_paths(image_folder, '/*vy.', ['png', 'PNG'])
-
-                vx_target_image_paths = vx_image_paths[0::frame_stride]
-                vy_target_image_paths = vy_image_paths[0::frame_stride]
+    print('Generate optical flow samples with %s datasets (%d tasks) ...' % (', '.join(target_datasets), len(tasks)))
+    for name, sample_count in run_tasks(generate_video_samples_opticalflow, tasks).items():
+        print('%s: %d samples are generated.' % (name, sample_count))
 
-                num_frames = len(vx_target_image_paths)
 
-                # read target images and preprocess them
-                sys.stdout.write('\t"%s" with frame stride %d and sample stride %d ... [0/%d]'
-                                 % (datasets[name]['name_format'] % video, frame_stride, sample_stride, num_frames))
-                read_pos = 0
-                sample_count_wrt_video = 0
-
-                for start_pos in range(0, num_frames, sample_stride):
-                    sys.stdout.write('\r\tAt "%s" with frame stride %d and sample stride %d ... [%d/%d]'
-                                     % (datasets[name]['name_format'] % video, frame_stride, sample_stride, start_pos, num_frames))
-
-                    # check end-of-processing
-                    if start_pos + target_length_optical > num_frames:
-                        break
-
-                    # reallocate already read images
-                    sample_data_x = np.roll(sample_data_x, sample_stride, axis=0)
-                    sample_data_y = np.roll(sample_data_y, sample_stride, axis=0)
-
-                    # read and preprocess only unread images
-                    vx_reading_images = vx_target_image_paths[read_pos:start_pos + target_length_optical]
-                    vy_reading_images = vy_target_image_paths[read_pos:start_pos + target_length_optical]
+# =============================================================================
+# GENERATE FRAME MEMORY MAPS
+# =============================================================================
+def generate_frame_memmaps():
+    # every frame of a video once, in '<type>_frames/<name>_video_<video>.npy' of (T, rows, cols) uint8.
+    # the cubes are cut from it at load time (see data.VideoFrameSets), with any frame stride and sample stride
+    for i, name in enumerate(target_datasets):
+        print('Generate frame memory maps with "%s" dataset ... [%d/%d]' % (name, i+1, len(target_datasets)))
 
-                    for j, path in enumerate(vx_reading_images):
-                        image_data = np.array(Image.open(path), dtype=numpy_dtype)
+        # output folder
+        frame_folder = os.path.join(datasets[name]['path'], datasets[name]['type'] + '_frames')
+        make_dir(frame_folder)
 
-                        # preprocessing
-                        if centering:
-                            image_data -= mean_vx
-                            image_data /= 255.0
+        for video in range(1, datasets[name]['num_videos'] + 1):
+            image_folder = os.path.join(datasets[name]['path'], '%sing_videos' % datasets[name]['type'],
+                                        os.path.splitext(datasets[name]['name_format'] % video)[0])
+            image_paths = get_file_paths(image_folder, '/*.', ['png', 'PNG'])
 
-                        # insert to sample container
-                        sample_data_x[read_pos - start_pos + j] = image_data
+            frames = np.lib.format.open_memmap(
+                os.path.join(frame_folder, '%s_video_%02d.npy' % (datasets[name]['name'], video)),
+                mode='w+', dtype=np.uint8, shape=(len(image_paths), target_rows, target_cols))
+            for j, path in enumerate(image_paths):
+                frames[j] = np.array(Image.open(path), dtype=np.uint8)
+            frames.flush()
+            del frames
+            print('\t"%s" is done! (%d frames)' % (datasets[name]['name_format'] % video, len(image_paths)))
 
-                    for j, path in enumerate(vy_reading_images):
-                        image_data = np.array(Image.open(path), dtype=numpy_dtype)
 
-                        # preprocessing
-                        if centering:
-                            image_data -= mean_vy
-                            image_data /= 255.0
+def generate_frame_memmaps_opticalflow():
+    # (T, 2, rows, cols) uint8 per video, channel 0 = vx and 1 = vy (see data.OpticalFlowFrameSets)
+    for i, name in enumerate(target_datasets):
+        print('Generate optical flow memory maps with "%s" dataset ... [%d/%d]' % (name, i+1, len(target_datasets)))
 
-                        # insert to sample container
-                        sample_data_y[read_pos - start_pos + j] = image_data
+        # output folder
+        frame_folder = os.path.join(DATASET_BASE_PATH, datasets[name]['name'], 'optical_flow',
+                                    datasets[name]['type'] + '_frames')
+        make_dir(frame_folder)
 
-                    # different file name format and index among set type
-                    file_name_format = '%s_video_%02d' % (datasets[name]['name'], video) \
-                                          + '_frame_interval_%d_stride_%d_%06d'
+        for video in range(1, datasets[name]['num_videos'] + 1):
+            image_folder = os.path.join(DATASET_BASE_PATH, datasets[name]['name'], 'optical_flow',
+                                        '%sing_videos' % datasets[name]['type'],
+                                        os.path.splitext(datasets[name]['name_format'] % video)[0])
+            vx_image_paths = get_file_paths(image_folder, '/*vx.', ['png', 'PNG'])
+            vy_image_paths = get_file_paths(image_folder, '/*vy.', ['png', 'PNG'])
+            assert len(vx_image_paths) == len(vy_image_paths)
 
-                    file_name_index = sample_count_wrt_video
+            frames = np.lib.format.open_memmap(
+                os.path.join(frame_folder, '%s_video_%02d.npy' % (datasets[name]['name'], video)),
+                mode='w+', dtype=np.uint8, shape=(len(vx_image_paths), 2, target_rows, target_cols))
+            for j, (vx_path, vy_path) in enumerate(zip(vx_image_paths, vy_image_paths)):
+                frames[j, 0] = np.array(Image.open(vx_path), dtype=np.uint8)
+                frames[j, 1] = np.array(Image.open(vy_path), dtype=np.uint8)
+            frames.flush()
+            del frames
+            print('\t"%s" is done! (%d frames)' % (datasets[name]['name_format'] % video, len(vx_image_paths)))
 
-                    save_file_path = os.path.join(DATASET_BASE_PATH, datasets[name]['name'], 'optical_flow', datasets[name]['type'],
-                                                  file_name_format % (frame_stride, sample_stride, file_name_index))
 
-                    sample_data[0:target_length_optical] = sample_data_x
-                    sample_data[target_length_optical:2*target_length_optical] = sample_data_y
+# =============================================================================
+# STREAMING GENERATION (NO INTERMEDIATE PNG FRAMES)
+# =============================================================================
+def read_video_frames(video_path):
+    # rescaled gray frames of a video, decoded by ffmpeg into a pipe, as (rows, cols) uint8 arrays
+    command = [FFMPEG_BIN,
+               '-i', video_path,
+               '-s', str(target_cols) + 'x' + str(target_rows),  # [width x height]
+               '-pix_fmt', 'gray',  # to gray scale
+               '-f', 'rawvideo', '-loglevel', 'error', '-']
+    frame_size = target_rows * target_cols
+    pipe = sp.Popen(command, stdout=sp.PIPE, bufsize=10 * frame_size)
+    num_frames = 0
+    try:
+        while True:
+            raw_frame = pipe.stdout.read(frame_size)
+            if len(raw_frame) < frame_size:
+                break
+            num_frames += 1
+            yield np.frombuffer(raw_frame, dtype=np.uint8).reshape(target_rows, target_cols)
+    finally:
+        pipe.stdout.close()
+        return_code = pipe.wait()
+    # a missing or broken video ends the stream early; not a short video
+    if return_code != 0:
+        raise RuntimeError('ffmpeg failed (exit code %d) on %s' % (return_code, video_path))
+    if num_frames == 0:
+        raise RuntimeError('no frame decoded from %s' % video_path)
+
+
+def stream_video_samples(task):
+    # one decoding pass over one video: the sum of its frames (for the mean image) and the uint8 cubes of every
+    # frame stride, cut from a ring buffer per frame stride. with sample_format 'frames', the frames are appended to
+    # the frame memory map instead, whose header gets the number of frames at the end
+    name, video = task
+    sample_stride = datasets[name]['sample_stride']
+    frame_strides = get_frame_strides(name)
+    video_path = os.path.join(datasets[name]['path'], '%sing_videos' % datasets[name]['type'],
+                              datasets[name]['name_format'] % video)
+    file_name_format = '%s_video_%02d' % (datasets[name]['name'], video) + '_frame_interval_%d_stride_%d_%06d'
+
+    # per frame stride: ring buffer of the last target_length frames, and number of frames put in it
+    ring_buffers = {frame_stride: np.zeros((target_length, target_rows, target_cols), dtype=np.uint8)
+                    for frame_stride in frame_strides}
+    num_buffered = dict.fromkeys(frame_strides, 0)
+    frame_sum = np.zeros((target_rows, target_cols), dtype=np.float64)
+    frame_file = None
+    if sample_format == 'frames':
+        frame_file = open(os.path.join(datasets[name]['path'], datasets[name]['type'] + '_frames',
+                                       '%s_video_%02d.npy' % (datasets[name]['name'], video)), 'wb')
+        write_npy_header(frame_file, np.uint8, (0, target_rows, target_cols))
+    sample_count = 0
+    frame_index = -1
+    for frame_index, frame in enumerate(read_video_frames(video_path)):
+        frame_sum += frame
+        if frame_file is not None:
+            frame_file.write(frame.tobytes())
+            continue
 
-                    np.save(save_file_path, sample_data)
+        for frame_stride in frame_strides:
+            if 0 != frame_index % frame_stride:
+                continue
+            ring_buffers[frame_stride][num_buffered[frame_stride] % target_length] = frame
+            num_buffered[frame_stride] += 1
+
+            # a window ends at this frame
+            start_pos = num_buffered[frame_stride] - target_length
+            if start_pos < 0 or 0 != start_pos % sample_stride:
+                continue
+            save_file_path = os.path.join(datasets[name]['path'], datasets[name]['type'],
+                                          file_name_format % (frame_stride, sample_stride, start_pos // sample_stride))
+            np.save(save_file_path, ring_buffers[frame_stride][get_ring_order(start_pos)])
+            sample_count += 1
+
+    if frame_file is not None:
+        write_npy_header(frame_file, np.uint8, (frame_index + 1, target_rows, target_cols))
+        frame_file.close()
+    print('\tAt "%s" is done! (%d frames, %d samples)'
+          % (datasets[name]['name_format'] % video, frame_index + 1, sample_count))
+    return name, frame_sum, frame_index + 1, sample_count
+
+
+def stream_samples():
+    # same file names as extract_video_frames + get_mean_image + generate_samples without centering (the cubes are in
+    # time order), one task per (dataset, video)
+    tasks = []
+    for name in target_datasets:
+        # output folder
+        if sample_format == 'frames':
+            make_dir(os.path.join(datasets[name]['path'], datasets[name]['type'] + '_frames'))
+        else:
+            make_dir(os.path.join(datasets[name]['path'], datasets[name]['type']))
+        for video in range(1, datasets[name]['num_videos'] + 1):
+            tasks.append((name, video))
+
+    print('Stream samples with %s datasets (%d tasks) ...' % (', '.join(target_datasets), len(tasks)))
+    mean_images = {name: np.zeros((target_rows, target_cols), dtype=np.float64) for name in target_datasets}
+    count_images = dict.fromkeys(target_datasets, 0)
+    sample_counts = dict.fromkeys(target_datasets, 0)
+    pool = Pool(num_workers)
+    for name, frame_sum, frame_count, sample_count in pool.imap_unordered(stream_video_samples, tasks):
+        mean_images[name] += frame_sum
+        count_images[name] += frame_count
+        sample_counts[name] += sample_count
+    pool.close()
+    pool.join()
 
-                    stride_sample_count += 1
-                    sample_count_wrt_video += 1
-                    read_pos = start_pos + target_length_optical
+    for name in target_datasets:
+        if datasets[name]['type'] == 'train':
+            # save mean image .npy and .png
+            assert count_images[name] > 0
+            mean_image = mean_images[name] / count_images[name]
+            np.save(os.path.join(datasets[name]['path'], 'mean_image'), mean_image)
+            Image.fromarray(np.uint8(mean_image)).save(os.path.join(datasets[name]['path'], 'mean_image.png'))
+        print('%s: %d samples are generated.' % (name, sample_counts[name]))
+
+
+def write_npy_header(file, dtype, shape):
+    # .npy (version 1.0) header of a fixed size (128 bytes), so it can be written again in place once the number of
+    # frames is known
+    header = repr({'descr': np.dtype(dtype).str, 'fortran_order': False, 'shape': tuple(shape)})
+    header = header.ljust(128 - 10 - 1) + '\n'
+    file.seek(0)
+    file.write(np.lib.format.magic(1, 0) + struct.pack('<H', len(header)) + header.encode('latin1'))
+
+
+def write_flow_batch(flow_file, flow_batch):
+    # (rows, cols, 2) flows => (n, 2, rows, cols) block in the file; returns the sum of the block
+    flow_block = np.ascontiguousarray(np.stack(flow_batch).transpose(0, 3, 1, 2))
+    flow_file.write(flow_block.tobytes())
+    return flow_block.sum(axis=0, dtype=np.float64)
+
+
+def extract_video_flow(task):
+    # Farneback flow of one video, decoded once through the ffmpeg pipe. the flows are appended in batches to the
+    # .npy memory map, whose header gets the number of flows at the end
+    name, video = task
+    cv2.setNumThreads(1)  # one video per process
+    video_path = os.path.join(datasets[name]['path'], '%sing_videos' % datasets[name]['type'],
+                              datasets[name]['name_format'] % video)
+    flow_path = os.path.join(DATASET_BASE_PATH, datasets[name]['name'], 'optical_flow',
+                             datasets[name]['type'] + '_frames', '%s_video_%02d.npy' % (datasets[name]['name'], video))
+
+    flow_sum = np.zeros((2, target_rows, target_cols), dtype=np.float64)
+    flow_count = 0
+    flow_batch = []
+    prev_frame = None
+    with open(flow_path, 'wb') as flow_file:
+        write_npy_header(flow_file, np.int16, (0, 2, target_rows, target_cols))
+        for frame in read_video_frames(video_path):
+            if prev_frame is not None:
+                flow = cv2.calcOpticalFlowFarneback(prev_frame, frame, None, *farneback_params)
+                flow = np.clip(flow, -flow_clip, flow_clip)
+                flow_batch.append(np.round(flow * flow_scale).astype(np.int16))
+            prev_frame = frame
+            if len(flow_batch) < flow_batch_size:
+                continue
+            flow_sum += write_flow_batch(flow_file, flow_batch)
+            flow_count += len(flow_batch)
+            flow_batch = []
+        if flow_batch:
+            flow_sum += write_flow_batch(flow_file, flow_batch)
+            flow_count += len(flow_batch)
+        write_npy_header(flow_file, np.int16, (flow_count, 2, target_rows, target_cols))
+    print('\tAt "%s" is done! (%d flows)' % (datasets[name]['name_format'] % video, flow_count))
+    return name, flow_sum, flow_count
+
+
+def generate_opticalflow_memmaps():
+    # flow memory maps of every video, and mean_cube.npy (9 mean vx, then 9 mean vy, in quantized units) and
+    # flow_range.npy of the train sets, in one pass. one task per (dataset, video)
+    assert flow_clip * flow_scale <= np.iinfo(np.int16).max, 'flow_clip * flow_scale is out of the int16 range'
+    tasks = []
+    for name in target_datasets:
+        make_dir(os.path.join(DATASET_BASE_PATH, datasets[name]['name'], 'optical_flow',
+                              datasets[name]['type'] + '_frames'))
+        for video in range(1, datasets[name]['num_videos'] + 1):
+            tasks.append((name, video))
+
+    print('Extract optical flow with %s datasets (%d tasks) ...' % (', '.join(target_datasets), len(tasks)))
+    flow_sums = {name: np.zeros((2, target_rows, target_cols), dtype=np.float64) for name in target_datasets}
+    flow_counts = dict.fromkeys(target_datasets, 0)
+    pool = Pool(num_workers)
+    for name, flow_sum, flow_count in pool.imap_unordered(extract_video_flow, tasks):
+        flow_sums[name] += flow_sum
+        flow_counts[name] += flow_count
+    pool.close()
+    pool.join()
 
-                print('\r\tAt "%s" with frame stride %d and sample stride %d is done!          '
-                      % (datasets[name]['name_format'] % video, frame_stride, sample_stride))
+    target_length_optical = target_length - 1
+    for name in target_datasets:
+        if datasets[name]['type'] == 'train':
+            assert flow_counts[name] > 0
+            mean_flow = flow_sums[name] / flow_counts[name]
+            mean_cube = np.concatenate([mean_flow[0:1].repeat(target_length_optical, axis=0),
+                                        mean_flow[1:2].repeat(target_length_optical, axis=0)])
+            optical_flow_path = os.path.join(DATASET_BASE_PATH, datasets[name]['name'], 'optical_flow')
+            np.save(os.path.join(optical_flow_path, 'mean_cube'), mean_cube)
+            np.save(os.path.join(optical_flow_path, 'flow_range'), np.float64(flow_clip * flow_scale))
+        print('%s: %d flows are extracted.' % (name, flow_counts[name]))
 
-            total_sample_count += stride_sample_count
 
-        print('%d samples are generated.' % total_sample_count)
 # todo - 저장한 파일의 명세서 저장할 것. 크기, 프레임 등
 # =============================================================================
 # MAIN PROCEDURE
 # =============================================================================
-if(opticalflow_version):
-    get_mean_image_opticalflow()
-    generate_samples_opticalflow()
-else:
-    extract_video_frames()
-    get_mean_image()
-    generate_samples()
+# (guarded, since the process pool workers import this module)
+if __name__ == '__main__':
+    if(opticalflow_version and streaming_decode):
+        generate_opticalflow_memmaps()
+    elif(opticalflow_version):
+        get_mean_image_opticalflow()
+        if sample_format == 'frames':
+            generate_frame_memmaps_opticalflow()
+        else:
+            generate_samples_opticalflow()
+    elif streaming_decode:
+        stream_samples()
+    else:
+        extract_video_frames()
+        get_mean_image()
+        if sample_format == 'frames':
+            generate_frame_memmaps()
+        else:
+            generate_samples()
 
 
 
@@ -1,13 +1,25 @@
 import numpy as np
 import os
 import glob
+import struct
+import subprocess as sp
 from PIL import Image
 
+FFMPEG_BIN = "ffmpeg"
 
 filenames = ["full_test"]
 folder_path = '/home/leejeyeol/Data/endoscope_only'
 save_path = '/home/leejeyeol/Data/endoscope_only/frames'
 
+# when '<folder_path>/<file>' is a video file: decode it through an ffmpeg pipe and write the unique frames in one frame
+# memory map, '<save_path>/<file>/frames.npy' (see data.get_image_samples). a folder of PNG frames (or any file with
+# streaming_decode = False) is saved frame by frame as .npy + .png
+streaming_decode = True
+# a frame is a duplicate (held frame) of the previous one when its thumbnail, every 'duplicate_step'-th pixel, differs
+# by at most 'duplicate_tolerance' levels. a tolerance above 0 absorbs the noise of re-encoded held frames
+duplicate_step = 8
+duplicate_tolerance = 2
+
 # image size
 x_size = 255
 y_size = 255
@@ -45,20 +57,89 @@ def get_file_paths(path, separator , file_type):
     file_paths.sort()
     return file_paths
 
-print("save folder make done")
-make_dir(save_path)
-for file in filenames:
-    print("%s file set" % file)
-    mean_image = np.zeros((x_crop_size, y_crop_size, 3), dtype=np.float)  # mean image container
+def read_video_frames(video_path):
+    # center crops of the RGB frames of a video, decoded by ffmpeg into a pipe, as (rows, cols, 3) uint8 arrays
+    command = [FFMPEG_BIN,
+               '-i', video_path,
+               '-vf', 'crop=%d:%d' % (x_crop_size, y_crop_size),  # [width:height], centered
+               '-pix_fmt', 'rgb24',
+               '-f', 'rawvideo', '-loglevel', 'error', '-']
+    frame_size = y_crop_size * x_crop_size * 3
+    pipe = sp.Popen(command, stdout=sp.PIPE, bufsize=10 * frame_size)
+    try:
+        while True:
+            raw_frame = pipe.stdout.read(frame_size)
+            if len(raw_frame) < frame_size:
+                break
+            # writable copy, the corners are blanked in place
+            yield np.frombuffer(raw_frame, dtype=np.uint8).reshape(y_crop_size, x_crop_size, 3).copy()
+    finally:
+        pipe.stdout.close()
+        return_code = pipe.wait()
+    if return_code != 0:
+        raise RuntimeError('ffmpeg failed (exit code %d) on %s' % (return_code, video_path))
+
+
+def write_npy_header(file, dtype, shape):
+    # .npy (version 1.0) header of a fixed size (128 bytes), so it can be written again in place once the number of
+    # frames is known
+    header = repr({'descr': np.dtype(dtype).str, 'fortran_order': False, 'shape': tuple(shape)})
+    header = header.ljust(128 - 10 - 1) + '\n'
+    file.seek(0)
+    file.write(np.lib.format.magic(1, 0) + struct.pack('<H', len(header)) + header.encode('latin1'))
+
+
+def get_thumbnail(image):
+    return image[::duplicate_step, ::duplicate_step].astype(np.int16)
+
+
+def is_duplicate(thumbnail, prev_thumbnail):
+    return prev_thumbnail is not None and np.abs(thumbnail - prev_thumbnail).max() <= duplicate_tolerance
+
+
+def extract_video(file):
+    # one decoding pass: the first frame of every run of held frames is appended to the (T, 3, x, y) uint8 frame
+    # memory map (the layout of the .npy samples), whose header gets T at the end, and added to the float64 sum of
+    # the mean image
+    video_path = os.path.join(folder_path, file)
+    frame_path = os.path.join(save_path, os.path.splitext(file)[0], 'frames.npy')
+
+    frame_sum = np.zeros((y_crop_size, x_crop_size, 3), dtype=np.float64)
+    num_frames, num_decoded = 0, 0
+    prev_thumbnail = None
+    with open(frame_path, 'wb') as frame_file:
+        write_npy_header(frame_file, np.uint8, (0, 3, x_crop_size, y_crop_size))
+        for cur_image in read_video_frames(video_path):
+            num_decoded += 1
+            cur_image = remove_part_of_image(cur_image, 0, 0, 20, 20)
+            cur_image = remove_part_of_image(cur_image, 0, 207, 20, 20)
+
+            thumbnail = get_thumbnail(cur_image)
+            if is_duplicate(thumbnail, prev_thumbnail):
+                continue
+            prev_thumbnail = thumbnail
+
+            frame_file.write(np.ascontiguousarray(np.swapaxes(cur_image, 0, 2)).tobytes())
+            frame_sum += cur_image
+            num_frames += 1
+        if num_frames == 0:
+            raise RuntimeError('no frame decoded from %s' % video_path)
+        write_npy_header(frame_file, np.uint8, (num_frames, 3, x_crop_size, y_crop_size))
+    print("%d unique frames of %d saved" % (num_frames, num_decoded))
+    return frame_sum / num_frames
+
+
+def extract_image_frames(file):
+    # PNG frames of '<folder_path>/<file>', saved one by one as .npy and .png
+    mean_image = np.zeros((x_crop_size, y_crop_size, 3), dtype=np.float64)  # mean image container
     image_axis = None    # image container
     save_image_idx = 0  # index for save
-    make_dir(os.path.join(save_path, file))
     # call image frames per file
     image_folder = os.path.join(folder_path, os.path.splitext(file)[0])
     image_files = get_file_paths(image_folder, '/*.', ['png', 'PNG'])
     for path in image_files:
         # call image frame
-        cur_image = np.array(Image.open(path), dtype=np.float)      # put image in container
+        cur_image = np.array(Image.open(path), dtype=np.float64)      # put image in container
         cur_image = crop_center(cur_image, x_crop_size, y_crop_size)
         cur_image = remove_part_of_image(cur_image, 0, 0, 20, 20)
         cur_image = remove_part_of_image(cur_image, 0, 207, 20, 20)
@@ -75,9 +156,24 @@ for file in filenames:
 
             save_image_idx = save_image_idx + 1
             image_axis = None
+    return mean_image
+
+
+print("save folder make done")
+make_dir(save_path)
+for file in filenames:
+    print("%s file set" % file)
+    is_video = streaming_decode and os.path.isfile(os.path.join(folder_path, file))
+    # outputs of a video are named by its stem, like its frame folder
+    output_name = os.path.splitext(file)[0] if is_video else file
+    make_dir(os.path.join(save_path, output_name))
+    if is_video:
+        mean_image = extract_video(file)
+    else:
+        mean_image = extract_image_frames(file)
     # save mean image
-    np.save(os.path.join(save_path, file + "_mean_image"), np.swapaxes(mean_image, 0, 2))
-    Image.fromarray(np.uint8(mean_image)).save(os.path.join(save_path, file + "_mean_image.png"))
+    np.save(os.path.join(save_path, output_name + "_mean_image"), np.swapaxes(mean_image, 0, 2))
+    Image.fromarray(np.uint8(mean_image)).save(os.path.join(save_path, output_name + "_mean_image.png"))
     print("%s file end" % file)
 print("done")
 
@@ -138,8 +138,9 @@ for grid_number in range(0, 25):
 mean_image = temp/25
 
 
-dataset = Grid_RGBImageSets(dataset_paths, centered=False, video_ids=video_ids)
-dataloader = torch.utils.data.DataLoader(dataset=dataset, batch_size=25, shuffle=False,
+# one sample is the 25 cells of a frame, so each frame is loaded once (no further batching)
+dataset = Grid_RGBImageSets(dataset_paths, centered=False, video_ids=video_ids, whole_frame=True)
+dataloader = torch.utils.data.DataLoader(dataset=dataset, batch_size=None, shuffle=False,
                                          num_workers=1, pin_memory=True)
 
 # streaming buffer
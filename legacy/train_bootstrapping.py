@@ -8,7 +8,7 @@ import numpy as np
 import torch.optim as optim
 import torch.utils.data
 import utils as util
-from data import VideoClipBootstrappingSets
+from data import VideoClipBootstrappingSets, PersistentLoader, BootstrappingSampler
 from torch.autograd import Variable
 
 from legacy.models import init_model_and_loss
@@ -34,6 +34,8 @@ parser.add_argument('--l2_coef', type=float, default=0.0005, help='coef of L2 re
 parser.add_argument('--var_loss_coef', type=float, default=1.0, help='balancing coef of vairational loss. default=0')
 parser.add_argument('--margin_sigma', type=float, default=1.5, help='Multiplier on MSE sigma for margin. default=2.5')
 parser.add_argument('--resample_interval', type=int, default=10, help="resampling interval. default=10")
+parser.add_argument('--weighted_resampling', action='store_true', default=False,
+                    help='draw resampled data in proportion to the sampling probabilities. default=False (Bernoulli)')
 parser.add_argument('--z_perturb', action='store_true', default=False, help='Perturbation z with MSE. default=False')
 # training related ------------------------------------------------------------
 parser.add_argument('--model_path', type=str, default='', help='path of pretrained network. default=""')
@@ -260,6 +262,10 @@ if options.continue_train:
         train_info['prev_iter_count'] += prev_train_info['prev_iter_count']
 
 num_samples_before_sampling = len(dataset)
+# the training epochs iterate the bootstrapping sampler, whose index set is drawn again at each resampling; the
+# dataset (and the loader's workers) stay as they are
+sampler = BootstrappingSampler(num_samples_before_sampling, weighted=options.weighted_resampling)
+dataloader = PersistentLoader(dataset, batch_size=options.batch_size, num_workers=options.workers)
 learning_margin = 0
 margin = 0
 for epoch in range(options.epochs):
@@ -267,8 +273,7 @@ for epoch in range(options.epochs):
     # =============================================================================
     # NETWORK TRAINING
     # =============================================================================
-    dataloader = torch.utils.data.DataLoader(dataset=dataset, batch_size=options.batch_size, shuffle=True,
-                                             num_workers=options.workers)
+    dataloader.set_sampler(sampler)
 
     print('Start training...')
     min_loss = options.nc * options.image_size * options.image_size
@@ -387,10 +392,7 @@ for epoch in range(options.epochs):
     # =============================================================================
     # RESAMPLING
     # =============================================================================
-    sampling_prob = [1.0] * num_samples_before_sampling
-    dataset.resampling(sampling_prob)
-    dataloader = torch.utils.data.DataLoader(dataset=dataset, batch_size=options.batch_size, shuffle=False,
-                                             num_workers=options.workers)
+    dataloader.set_indices(np.arange(num_samples_before_sampling), shuffle=False)
 
     print('Start testing...')
     model.eval()
@@ -427,12 +429,10 @@ for epoch in range(options.epochs):
     print('[%4d/%4d] margin: %.3f, MSE: min=%.3f, max=%.3f, mean=%.3f, std=%.3f' %
           (epoch + 1, options.epochs, margin, MSE_min, MSE_max, MSE_mean, MSE_std))
 
-    sampling_prob = [min((mse - MSE_min) / (margin - MSE_min), 1) for mse in sample_MSE]
+    sampling_prob = np.minimum((MSE_np - MSE_min) / (margin - MSE_min), 1)
     print(' Resampling...')
-    while True:
-        dataset.resampling(sampling_prob)
-        if len(dataset) > 0:
-            break
-    print(' Resampled data %d (%.3f percent)' % (len(dataset), len(dataset) / num_samples_before_sampling * 100))
+    sample_indices = sampler.resample(sampling_prob)
+    print(' Resampled data %d (%.3f percent)'
+          % (len(sample_indices), len(sample_indices) / num_samples_before_sampling * 100))
 #()()
 #('')HAANJU.YOO
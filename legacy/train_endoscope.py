@@ -7,7 +7,7 @@ import time
 import torch.optim as optim
 import torch.utils.data
 import utils as util
-from data import RGBImageSets
+from data import RGBImageSets, DedupSampler, load_dedup_clusters
 from torch.autograd import Variable
 
 from legacy.models import init_model_and_loss
@@ -42,6 +42,9 @@ parser.add_argument('--dataset', type=str, required=True, nargs='+',
 parser.add_argument('--data_root', type=str, required=True, help='path to base folder of entire dataset')
 parser.add_argument('--image_size', type=int, default=227, help='input image size (width=height). default=227')
 parser.add_argument('--workers', type=int, default=2, help='number of data loading workers')
+parser.add_argument('--dedup_distance', type=int, default=-1,
+                    help='draw one sample per cluster of near-duplicates (perceptual hashes within this number of '
+                         'bits) per epoch. default=-1 (every sample)')
 # optimization related --------------------------------------------------------
 parser.add_argument('--optimizer', type=str, default='adagrad',
                     help='type of optimizer: adagrad | adam | asgd | sgd. default=adagrad')
@@ -163,8 +166,17 @@ win_images = dict(
 # set data loader
 dataset_paths = options.data_root
 dataset = RGBImageSets(dataset_paths, centered=False, video_ids=["video_train"])
-dataloader = torch.utils.data.DataLoader(dataset=dataset, batch_size=options.batch_size, shuffle=True,
-                                         num_workers=options.workers)
+if options.dedup_distance >= 0:
+    # the hashes are made once per dataset folder
+    clusters = load_dedup_clusters(dataset, os.path.join(dataset_paths, "perceptual_hashes.npz"), options.dedup_distance,
+                                   num_workers=options.workers)
+    sampler = DedupSampler(clusters)
+    print('%d near-duplicate clusters of %d samples' % (len(sampler), len(dataset)))
+    dataloader = torch.utils.data.DataLoader(dataset=dataset, batch_size=options.batch_size, sampler=sampler,
+                                             num_workers=options.workers)
+else:
+    dataloader = torch.utils.data.DataLoader(dataset=dataset, batch_size=options.batch_size, shuffle=True,
+                                             num_workers=options.workers)
 
 debug_print('Data loader is ready')
 
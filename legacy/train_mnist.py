@@ -13,9 +13,8 @@ import torch.optim as optim
 import torch.utils.data
 import utils as util
 from torch.autograd import Variable
-from torchvision import transforms
 
-from legacy.MNIST.MNIST_data import myMNIST
+from legacy.MNIST.MNIST_data import myMNIST, TensorBatchLoader
 
 parser = argparse.ArgumentParser(description='PyTorch MNIST Example')
 parser.add_argument('--batch-size', type=int, default=128, metavar='N',
@@ -45,14 +44,14 @@ sampling_prob = [1.0] * 10
 # sampling_prob = [0.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0]
 #                  0    1    2    3    4    5    6    7    8    9
 
-kwargs = {'num_workers': 1, 'pin_memory': True} if args.cuda else {}
-train_loader = torch.utils.data.DataLoader(
-    myMNIST('./MNIST_DATA', train=True, download=True,
-                   transform=transforms.ToTensor(), sampling_prob=sampling_prob),
-    batch_size=args.batch_size, shuffle=True, **kwargs)
-test_loader = torch.utils.data.DataLoader(
-    myMNIST('./MNIST_DATA', train=False, transform=transforms.ToTensor(), sampling_prob=sampling_prob),
-    batch_size=args.batch_size, shuffle=False, **kwargs)
+# the whole set is one uint8 tensor (on the GPU with cuda); batches are gathered from it without a DataLoader
+train_set = myMNIST('./MNIST_DATA', train=True, download=True, sampling_prob=sampling_prob, tensor_native=True)
+test_set = myMNIST('./MNIST_DATA', train=False, sampling_prob=sampling_prob, tensor_native=True)
+if args.cuda:
+    train_set.to_cuda()
+    test_set.to_cuda()
+train_loader = TensorBatchLoader(train_set, batch_size=args.batch_size, shuffle=True)
+test_loader = TensorBatchLoader(test_set, batch_size=args.batch_size, shuffle=False)
 
 
 def imshow(img, title=None):
@@ -341,6 +340,7 @@ def test(epoch, save_path=None):
     test_loss = 0
     num_digits = [0] * 10
     for data, labels in test_loader:
+        labels = labels.cpu()
         if args.cuda:
             data = data.cuda()
         data = Variable(data, volatile=True)
@@ -7,7 +7,7 @@ import time
 import torch.optim as optim
 import torch.utils.data
 import utils as util
-from data import OpticalFlowSets
+from data import OpticalFlowSets, OpticalFlowFrameSets, get_frame_path
 from torch.autograd import Variable
 
 from legacy.models import init_model_and_loss
@@ -162,7 +162,11 @@ win_images = dict(
 # =============================================================================
 # set data loader
 dataset_paths, mean_cubes = util.get_dataset_paths_and_mean_images(options.dataset, options.data_root, 'train', True)
-dataset = OpticalFlowSets(dataset_paths, centered=False)
+if all(os.path.exists(get_frame_path(path)) for path in dataset_paths):
+    # flow memory maps made by NIPS2017_generate_sample.py
+    dataset = OpticalFlowFrameSets(dataset_paths, centered=False)
+else:
+    dataset = OpticalFlowSets(dataset_paths, centered=False)
 dataloader = torch.utils.data.DataLoader(dataset=dataset, batch_size=options.batch_size, shuffle=True,
                                          num_workers=options.workers)
 for path in dataset_paths:
@@ -199,6 +203,9 @@ util.target_sample_index = 0
 util.target_frame_index = int(options.nc / 2)
 util.mean_cubes = mean_cubes
 util.optical_flow = True
+if isinstance(dataset, OpticalFlowFrameSets) and dataset.value_scales:
+    # quantized flow memory maps: samples are divided by their flow range instead of 255
+    util.value_scale = max(dataset.value_scales.values())
 debug_print('Utility library is ready')
 
 
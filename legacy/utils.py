@@ -14,6 +14,7 @@ target_frame_index = 5
 mean_images = {}
 mean_cubes = {}
 optical_flow = False
+value_scale = 255  # stored value of a centered datum of 1 (255 for images, flow_range for quantized optical flow)
 
 # =============================================================================
 # SYSTEM
@@ -90,10 +91,17 @@ def sample_batch_to_image_RGB(batch_data):
 def decentering(image, mean_image):
 
     if mean_image.ndim == 3:
-        return image * 255 + mean_image
+        return to_pixel_values(image * value_scale + mean_image)
     elif mean_image.ndim > 3:
         mean_image = mean_image[5]
-    return gray_single_to_image(image * 255 + mean_image)
+    return gray_single_to_image(to_pixel_values(image * value_scale + mean_image))
+
+
+def to_pixel_values(stored_values):
+    # quantized optical flow (-value_scale~+value_scale) to 0~255 for display; images are already 0~255
+    if value_scale == 255:
+        return stored_values
+    return (stored_values / value_scale * 0.5 + 0.5) * 255
 
 def decentering_grid(image, mean_image, grid_number, grid_unit = 4):
     grid_size = int(image.shape[1] / grid_unit)
@@ -10,6 +10,13 @@ from torch.autograd import Variable
 import torch.optim as optim
 
 import Datasets.RGBImageSet_augmented as dset
+import Datasets.RGBImageSet_packed as packed_dset
+import Datasets.RGBImageSet_virtual as virtual_dset
+from Datasets.ResidentLoader import ResidentLoader
+from Datasets.PersistentLoader import PersistentLoader
+from Datasets.Samplers import MaskAwareSampler, compute_valid_fractions
+from Datasets.Prefetcher import Prefetcher
+from Datasets.BatchAugmentation import BatchAugmentation
 import Models.AutoEncoder as model
 import PathManager as pm
 
@@ -23,6 +30,21 @@ parser.add_argument('--dataroot', default=os.path.join(pm.datasetroot, 'train_au
                     help='root path to dataset')
 parser.add_argument('--net', default='', help="path of networks.(to continue training)")
 parser.add_argument('--outf', default='./output', help="folder to output images and model checkpoints")
+parser.add_argument('--storage', default='files', choices=['files', 'packed', 'compressed', 'virtual'],
+                    help='files: per-sample .npy files, packed: store made by Make_packed_dataset.py, '
+                         'compressed: the packed store compressed by Compress_packed_dataset.py, '
+                         'virtual: crop and flip the original frames at load time')
+parser.add_argument('--resident', action='store_true',
+                    help='load the whole training set in memory and draw batches without loader workers')
+parser.add_argument('--min_valid_fraction', type=float, default=0.0,
+                    help='skip patches whose fraction of non-polyp pixels is below this value. default=0 (keep all)')
+parser.add_argument('--valid_weighting', action='store_true',
+                    help='draw patches with probability proportional to their fraction of non-polyp pixels')
+parser.add_argument('--batch_augmentation', action='store_true',
+                    help='random shift, flips and photometric jitter of each batch on the training device')
+parser.add_argument('--max_shift', type=int, default=16, help='max random shift (pixels) of batch augmentation')
+parser.add_argument('--brightness', type=float, default=0.05, help='max brightness offset of batch augmentation')
+parser.add_argument('--contrast', type=float, default=0.1, help='max contrast change of batch augmentation')
 # model
 parser.add_argument('--model', type=str, default='InfoGAN', help='Model name')
 parser.add_argument('--nc', type=int, default=3, help='number of input channel.')
@@ -75,10 +97,35 @@ win_recon_cost = None
 # MAIN LOOP
 # ======================================================================================================================
 cnt = 0
+# the dataset and the loader (and its workers) are made once; each fold is an index set on them
+if options.storage in ['packed', 'compressed']:
+    dataset = packed_dset.RGBImageSet_packed(options.dataroot, centered=False,
+                                             compressed=options.storage == 'compressed')
+elif options.storage == 'virtual':
+    dataset = virtual_dset.RGBImageSet_virtual(options.dataroot, centered=False)
+else:
+    dataset = dset.RGBImageSet_augmented(options.dataroot, centered=False)
+if options.resident:
+    dataloader = ResidentLoader(dataset, batch_size=options.batchSize)
+else:
+    dataloader = PersistentLoader(dataset, batch_size=options.batchSize, num_workers=options.workers)
+normalizer = dataset.get_batch_normalizer(cuda=options.cuda)
+# the next batches are loaded (and copied to the GPU) on a background thread while the current one is trained
+prefetcher = Prefetcher(dataloader, cuda=options.cuda)
+augmentation = None
+if options.batch_augmentation:
+    augmentation = BatchAugmentation(options.max_shift, flip=True, brightness=options.brightness,
+                                     contrast=options.contrast)
+mask_aware = options.min_valid_fraction > 0 or options.valid_weighting
+if mask_aware:
+    valid_fractions = compute_valid_fractions(dataset)
 for fold_number in range(10):
-    dataloader = torch.utils.data.DataLoader(
-        dset.RGBImageSet_augmented(options.dataroot, op_type='train', centered=False, fold_number=fold_number),
-        batch_size=options.batchSize, shuffle=True, num_workers=options.workers)
+    fold_indices = dataset.get_fold_indices(fold_number, op_type='train')
+    if mask_aware:
+        dataloader.set_sampler(MaskAwareSampler(valid_fractions[fold_indices], options.min_valid_fraction,
+                                                options.valid_weighting, indices=fold_indices))
+    else:
+        dataloader.set_indices(fold_indices, shuffle=True)
 
     # normalize to -1~1
     ngpu = int(options.ngpu)
@@ -125,17 +172,20 @@ for fold_number in range(10):
     # training start
     print("Training Start!")
     for epoch in range(options.iteration):
-        for i, (data, mask_, _) in enumerate(dataloader, 0):
+        for i, (data, mask_, _, patch_index) in enumerate(prefetcher, 0):
             ############################
             # (1) Update D network
             ###########################
             # train with real data
             optimizer.zero_grad()
 
-            real_cpu = data
+            real_cpu = normalizer.center(data, patch_index)
+            mask_ = normalizer.expand_mask(mask_, 1)
+            if augmentation is not None:
+                real_cpu, mask_ = augmentation(real_cpu, mask_)
             batch_size = real_cpu.size(0)
             input_tensor.data.resize_(real_cpu.size()).copy_(real_cpu)
-            mask_tensor.data.resize_(real_cpu.size()).copy_(mask_.float())
+            mask_tensor.data.resize_(real_cpu.size()).copy_(mask_.expand_as(real_cpu))
 
             output, z = net(input_tensor)
             output_for_vis = output.data
@@ -171,6 +221,8 @@ for fold_number in range(10):
                 cnt = cnt +1
                 time.sleep(0.005)  # for reliable drawing
 
+        print('[%d][%d/%d] waited %.2f sec for data' % (fold_number, epoch, options.iteration, prefetcher.wait_time))
+
         # checkpoint operation
         if (epoch+1) % options.iteration == 0:
 